@@ -1,22 +1,36 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory
 import db_funcs
-import uuid
 from functools import wraps
 import os
+import secrets
+from session_tokens import SessionTokens
+from jobs import AdminJobs
+import queue
 
 app = Flask(__name__)
 
-# In-memory session store (for demo; use persistent store in production)
-sessions = {}
+# Signed session tokens: any worker holding SECRET_KEY can verify them
+app.secret_key = os.environ.get('SECRET_KEY')
+if not app.secret_key:
+    # Tokens only verify in this process; set SECRET_KEY when running more than one
+    app.logger.warning('SECRET_KEY not set, using a random per-process key')
+    app.secret_key = secrets.token_hex(32)
+tokens = SessionTokens(app.secret_key, salt='poetry4n-session')
+
+# Long-running admin operations (phrase reset, game deletion and compaction)
+admin_jobs = AdminJobs()
+
+# Seconds between SSE keepalive comments, so idle proxies don't drop the stream
+SSE_KEEPALIVE = 15
 
 def require_session(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        session_token = request.headers.get('X-Session-Token')
-        if not session_token or session_token not in sessions:
+        session = tokens.verify(request.headers.get('X-Session-Token') or '')
+        if not session:
             return jsonify({'error': 'Invalid or missing session token'}), 401
-        request.player_id = sessions[session_token]['player_id']
-        request.game_id = sessions[session_token]['game_id']
+        request.player_id = session['player_id']
+        request.game_id = session['game_id']
         return f(*args, **kwargs)
     return decorated
 
@@ -43,18 +57,14 @@ def add_player():
         return jsonify({'error': 'Missing required fields'}), 400
     player_id = db_funcs.add_player(game_id, player_name, team)
     # Create session token
-    session_token = str(uuid.uuid4())
-    sessions[session_token] = {'player_id': player_id, 'game_id': game_id}
+    session_token = tokens.issue(player_id, game_id)
     # Remove auto-start logic here
     return jsonify({'player_id': player_id, 'session_token': session_token})
 
 @app.route('/list_games', methods=['GET'])
 def list_games():
+    # Shared, briefly cached snapshot with labels like "Game X (N players)"
     games = db_funcs.list_waiting_games()
-    # Add a label for each game (e.g. "Game X (N players)")
-    for g in games:
-        n_players = len(g['teamA']) + len(g['teamB'])
-        g['label'] = f"Game {g['game_id'][:8]} ({n_players} players)"
     return jsonify({'games': games})
 
 @app.route('/start_game', methods=['POST'])
@@ -94,6 +104,32 @@ def get_game(game_id):
         return jsonify({'error': 'Game not found'}), 404
     return jsonify(game)
 
+@app.route('/games/<game_id>/events', methods=['GET'])
+def game_events(game_id):
+    """Server-sent event stream: the full game once, then a diff per change."""
+    game = db_funcs.get_game(game_id)
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
+    q = db_funcs.subscribe_game(game_id, game)
+
+    def stream():
+        try:
+            yield f"event: state\ndata: {app.json.dumps(game)}\n\n"
+            while True:
+                try:
+                    diff = q.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {app.json.dumps(diff)}\n\n"
+        finally:
+            db_funcs.unsubscribe_game(game_id, q)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/get_phrase', methods=['GET'])
 def get_phrase():
     phrase = db_funcs.get_random_phrase()
@@ -104,43 +140,22 @@ def get_phrase():
 @app.route('/assign_points', methods=['POST'])
 @require_session
 def assign_points():
-    import datetime
     data = request.json
     points = data.get('points')  # int: 1, 3, or -1
     team = data.get('team')      # 'A' or 'B'
     if points not in [1, 3, -1] or team not in ['A', 'B']:
         return jsonify({'error': 'Invalid points or team'}), 400
-    game = db_funcs.get_game(request.game_id)
-    if not game:
+    # Score, check the timer and swap in the next phrase in a single commit
+    result = db_funcs.assign_points(request.game_id, team, points)
+    if not result:
         return jsonify({'error': 'Game not found'}), 404
-    # Update score
-    scores = game.get('scores', {'A': 0, 'B': 0})
-    scores[team] = scores.get(team, 0) + points
-    db_funcs.update_game_state(request.game_id, {'scores': scores})
-    # Check if timer expired
-    turn_end_time = game.get('turnEndTime')
-    expired = False
-    if turn_end_time:
-        # turnEndTime may be a datetime or string
-        if isinstance(turn_end_time, str):
-            try:
-                turn_end_time_dt = datetime.datetime.fromisoformat(turn_end_time.replace('Z', '+00:00'))
-            except Exception:
-                turn_end_time_dt = None
-        else:
-            turn_end_time_dt = turn_end_time
-        if turn_end_time_dt:
-            now = datetime.datetime.utcnow().replace(tzinfo=turn_end_time_dt.tzinfo)
-            if now > turn_end_time_dt:
-                expired = True
-    if expired:
-        # Do not assign a new phrase/word
+    scores = result['scores']
+    if result['expired']:
+        # The turn is over: the points count, but no new phrase/word
         return jsonify({'scores': scores, 'expired': True})
-    # Get new phrase
-    phrase_obj = db_funcs.get_random_phrase()
+    phrase_obj = result['phrase']
     if not phrase_obj:
         return jsonify({'error': 'No phrases available'}), 404
-    db_funcs.update_game_state(request.game_id, {'currentPhrase': phrase_obj['text'], 'currentWord': phrase_obj['word']})
     return jsonify({'scores': scores, 'phrase': phrase_obj['text'], 'word': phrase_obj['word']})
 
 @app.route('/start_turn', methods=['POST'])
@@ -166,32 +181,18 @@ def start_turn():
 @app.route('/end_turn', methods=['POST'])
 @require_session
 def end_turn():
-    game = db_funcs.get_game(request.game_id)
-    if not game:
+    # Alternate team and move to the next player in one atomic update
+    updates, error = db_funcs.end_turn(request.game_id, player_id=request.player_id)
+    if error == 'not_found':
         return jsonify({'error': 'Game not found'}), 404
-    # Alternate team
-    current_team = game.get('currentTeam', 'A')
-    next_team = 'B' if current_team == 'A' else 'A'
-    team_players = game.get(f'team{next_team}', [])
-    if not team_players:
+    if error == 'not_your_turn':
+        return jsonify({'error': 'Not your turn'}), 403
+    if error == 'no_players':
         return jsonify({'error': 'No players in next team'}), 400
-    # Get last index for next team
-    last_index_key = f'lastPlayerIndex{next_team}'
-    last_idx = game.get(last_index_key, -1)
-    next_idx = (last_idx + 1) % len(team_players)
-    next_player = team_players[next_idx]
+    next_team = updates['currentTeam']
+    next_player = updates['currentTurn']
     # Get next player's name
     next_player_name = db_funcs.get_player_name(request.game_id, next_player)
-    # Set state to waiting for ready and update last index
-    db_funcs.update_game_state(request.game_id, {
-        'currentTeam': next_team,
-        'currentTurn': next_player,
-        'turnReady': False,
-        'currentPhrase': None,
-        'currentWord': None,
-        'turnEndTime': None,
-        last_index_key: next_idx
-    })
     return jsonify({'nextTeam': next_team, 'nextPlayer': next_player, 'nextPlayerName': next_player_name})
 
 @app.route('/ready_turn', methods=['POST'])
@@ -221,13 +222,26 @@ def admin():
 
 @app.route('/admin/reset_phrases', methods=['POST'])
 def admin_reset_phrases():
-    db_funcs.reset_all_phrases()
-    return jsonify({'ok': True})
+    job = admin_jobs.start('reset_phrases', db_funcs.reset_all_phrases)
+    return jsonify({'ok': True, 'job': job}), 202
 
 @app.route('/admin/delete_games', methods=['POST'])
 def admin_delete_games():
-    db_funcs.delete_all_games()
-    return jsonify({'ok': True})
+    job = admin_jobs.start('delete_games', db_funcs.delete_all_games)
+    return jsonify({'ok': True, 'job': job}), 202
+
+@app.route('/admin/compact_games', methods=['POST'])
+def admin_compact_games():
+    # Safe to call on a schedule: only lobbies and games past their TTL are touched
+    job = admin_jobs.start('compact_games', db_funcs.compact_games)
+    return jsonify({'ok': True, 'job': job}), 202
+
+@app.route('/admin/jobs/<job_id>', methods=['GET'])
+def admin_job_status(job_id):
+    job = admin_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
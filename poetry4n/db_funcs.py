@@ -1,106 +1,157 @@
-from google.cloud import firestore
-from google.oauth2 import service_account
-from datetime import datetime
-import uuid
-# import os
-
-# Initialize Firestore client
-db = firestore.Client(
-    project="torch-3",
-    credentials=service_account.Credentials.from_service_account_file('service-account.json')
-)
+import threading
+import time
+import storage
+from events import GameEvents
+from turn_timer import TurnScheduler
+
+# Storage backend (firestore, memory or sqlite), chosen by POETRY4N_STORAGE
+engine = storage.get_storage()
+# Pushes game changes to /games/<id>/events subscribers in this process
+events = GameEvents()
+
+# Seconds a lobby listing is shared between /list_games callers
+LOBBY_TTL = 2.0
+_lobby = {'games': None, 'expires': 0.0}
+_lobby_lock = threading.Lock()
 
 def create_game():
-    game_id = str(uuid.uuid4())
-    game_ref = db.collection('games').document(game_id)
-    game_ref.set({
-        'state': 'waiting',
-        'createdAt': datetime.utcnow(),
-        'scores': {'A': 0, 'B': 0},
-        'teamA': [],
-        'teamB': [],
-        'round': 1
-    })
+    game_id = engine.create_game()
+    _invalidate_lobby()
     return game_id
 
 def add_player(game_id, player_name, team):
-    # Prevent duplicate players (same name and team in the same game)
-    players_ref = db.collection('games').document(game_id).collection('players')
-    existing_players = list(players_ref.where('name', '==', player_name).where('team', '==', team).stream())
-    if existing_players:
-        # Return the first matching player's ID
-        return existing_players[0].id
-    player_id = str(uuid.uuid4())
-    player_ref = players_ref.document(player_id)
-    player_ref.set({
-        'name': player_name,
-        'team': team,
-        'joinedAt': datetime.utcnow()
-    })
-    # Add player to team array in game doc
-    game_ref = db.collection('games').document(game_id)
-    game_ref.update({f'team{team}': firestore.ArrayUnion([player_id])})
+    player_id = engine.add_player(game_id, player_name, team)
+    _invalidate_lobby()
+    if events.has_subscribers(game_id):
+        game = engine.get_game(game_id) or {}
+        events.publish(game_id, {'teamA': game.get('teamA', []), 'teamB': game.get('teamB', [])})
     return player_id
 
 def get_game(game_id):
-    game_ref = db.collection('games').document(game_id)
-    return game_ref.get().to_dict()
+    return engine.get_game(game_id)
 
 def update_game_state(game_id, updates):
-    game_ref = db.collection('games').document(game_id)
-    game_ref.update(updates)
+    engine.update_game_state(game_id, updates)
+    if 'state' in updates:
+        _invalidate_lobby()
+    _track_turn_timer(game_id, updates)
+    events.publish(game_id, updates)
+
+def end_turn(game_id, player_id=None, turn_end_time=None):
+    """Pass the turn to the next player of the other team in one atomic update.
+
+    With player_id, only that player's turn is ended; with turn_end_time, only
+    the turn with that deadline is. Returns (updates, error) where error is
+    None, 'not_found', 'not_your_turn', 'stale' or 'no_players'.
+    """
+    error = None
+
+    def advance(game):
+        nonlocal error
+        error = None
+        if player_id is not None and game.get('currentTurn') != player_id:
+            error = 'not_your_turn'
+            return None
+        if turn_end_time is not None and not storage.same_instant(game.get('turnEndTime'), turn_end_time):
+            # The turn this timer was set for already ended or was restarted
+            error = 'stale'
+            return None
+        updates = storage.next_turn_updates(game)
+        if updates is None:
+            error = 'no_players'
+        return updates
+
+    game, updates = engine.transform_game(game_id, advance)
+    if game is None:
+        return None, 'not_found'
+    if updates:
+        _track_turn_timer(game_id, updates)
+        events.publish(game_id, updates)
+    return updates, error
+
+def _expire_turn(game_id, turn_end_time):
+    end_turn(game_id, turn_end_time=turn_end_time)
+
+# Ends turns when their turnEndTime passes, without waiting for a client
+turn_timers = TurnScheduler(_expire_turn)
+
+def _track_turn_timer(game_id, updates):
+    if 'turnEndTime' in updates:
+        if updates['turnEndTime']:
+            turn_timers.schedule(game_id, updates['turnEndTime'])
+        else:
+            turn_timers.cancel(game_id)
+
+def assign_points(game_id, team, points):
+    """Score a team and swap in the next phrase in one commit. See StorageEngine.assign_points."""
+    result = engine.assign_points(game_id, team, points)
+    if result:
+        changes = {'scores': result['scores']}
+        if result['phrase']:
+            changes['currentPhrase'] = result['phrase']['text']
+            changes['currentWord'] = result['phrase']['word']
+        events.publish(game_id, changes)
+    return result
+
+def subscribe_game(game_id, game):
+    """Start receiving state diffs for a game. Returns a queue of diff dicts."""
+    return events.subscribe(game_id, game, watch=engine.watch_game)
+
+def unsubscribe_game(game_id, q):
+    events.unsubscribe(game_id, q)
 
 def get_random_phrase():
-    phrases = list(db.collection('phrases').where('used', '==', False).stream())
-    if not phrases:
-        return None
-    phrase_doc = phrases[0]
-    # Optionally mark as used
-    phrase_doc.reference.update({'used': True})
-    data = phrase_doc.to_dict()
-    return {'text': data['text'], 'word': data['word']}
+    return engine.get_random_phrase()
 
 def list_waiting_games():
-    """Return a list of games in 'waiting' state with their IDs and player counts."""
-    games = db.collection('games').where('state', '==', 'waiting').stream()
-    result = []
-    for g in games:
-        data = g.to_dict()
-        result.append({
-            'game_id': g.id,
-            'createdAt': data.get('createdAt'),
-            'teamA': data.get('teamA', []),
-            'teamB': data.get('teamB', [])
-        })
-    return result
+    """Return a list of games in 'waiting' state with their IDs, labels and player counts.
+
+    All callers share one snapshot that is refreshed at most every LOBBY_TTL
+    seconds, or sooner when a game is created, joined or started here.
+    """
+    with _lobby_lock:
+        # Refresh under the lock so concurrent viewers wait for one query
+        if _lobby['games'] is None or time.monotonic() >= _lobby['expires']:
+            _lobby['games'] = [_lobby_entry(g) for g in engine.list_waiting_games()]
+            _lobby['expires'] = time.monotonic() + LOBBY_TTL
+        return [dict(g) for g in _lobby['games']]
+
+def _lobby_entry(game):
+    n_players = len(game['teamA']) + len(game['teamB'])
+    return {
+        'game_id': game['game_id'],
+        'label': f"Game {game['game_id'][:8]} ({n_players} players)",
+        'players': n_players,
+        'playersA': len(game['teamA']),
+        'playersB': len(game['teamB'])
+    }
+
+def _invalidate_lobby():
+    with _lobby_lock:
+        _lobby['games'] = None
+
+def reset_all_phrases(progress=None):
+    return engine.reset_all_phrases(progress=progress)
+
+def delete_all_games(progress=None):
+    try:
+        return engine.delete_all_games(progress=progress)
+    finally:
+        _invalidate_lobby()
 
-def reset_all_phrases():
-    phrases = db.collection('phrases').stream()
-    for phrase in phrases:
-        phrase.reference.update({'used': False})
-
-def delete_all_games():
-    games = db.collection('games').stream()
-    for game in games:
-        # Delete all players subcollection docs
-        try:
-            players = game.reference.collection('players').stream()
-            for player in players:
-                player.reference.delete()
-        except Exception:
-            pass
-        game.reference.delete()
+def compact_games(progress=None):
+    """Expire abandoned lobbies and archive idle games; returns how many were removed."""
+    try:
+        return engine.compact_games(progress=progress)
+    finally:
+        _invalidate_lobby()
 
 def get_player_name(game_id, player_id):
     """Return the player's name given game_id and player_id, or None if not found."""
-    player_ref = db.collection('games').document(game_id).collection('players').document(player_id)
-    player_doc = player_ref.get()
-    if player_doc.exists:
-        return player_doc.to_dict().get('name')
-    return None
+    return engine.get_player_name(game_id, player_id)
 
 # Example usage:
 # game_id = create_game()
 # player_id = add_player(game_id, "Alice", "A")
 # game = get_game(game_id)
-# phrase = get_random_phrase()
\ No newline at end of file
+# phrase = get_random_phrase()
@@ -0,0 +1,70 @@
+"""In-process fan-out of game state changes to server-sent event streams."""
+import queue
+import threading
+
+
+class GameEvents:
+    """Tracks the last known state of each watched game and pushes diffs to subscribers.
+
+    Every subscriber gets its own queue. publish() compares the changed fields
+    against the cached state, so repeated or echoed updates (for example a local
+    write followed by the Firestore snapshot of that same write) are only sent once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # game_id -> set of queues
+        self.states = {}       # game_id -> last state seen by subscribers
+        self.unwatch = {}      # game_id -> callable that stops a storage watch
+
+    def subscribe(self, game_id, game, watch=None):
+        """Register a subscriber and return its queue.
+
+        The first subscriber for a game seeds the cached state and, if given,
+        starts watch(game_id, callback) to pick up changes from other processes.
+        """
+        q = queue.Queue()
+        with self.lock:
+            subscribers = self.subscribers.setdefault(game_id, set())
+            first = not subscribers
+            subscribers.add(q)
+            if first:
+                self.states[game_id] = dict(game)
+        if first and watch:
+            stop = watch(game_id, lambda doc: self.publish(game_id, doc))
+            if stop:
+                with self.lock:
+                    self.unwatch[game_id] = stop
+        return q
+
+    def unsubscribe(self, game_id, q):
+        stop = None
+        with self.lock:
+            subscribers = self.subscribers.get(game_id)
+            if subscribers is None:
+                return
+            subscribers.discard(q)
+            if not subscribers:
+                del self.subscribers[game_id]
+                self.states.pop(game_id, None)
+                stop = self.unwatch.pop(game_id, None)
+        if stop:
+            stop()
+
+    def has_subscribers(self, game_id):
+        with self.lock:
+            return game_id in self.subscribers
+
+    def publish(self, game_id, changes):
+        """Send the fields of changes that differ from the cached state."""
+        with self.lock:
+            subscribers = self.subscribers.get(game_id)
+            if not subscribers:
+                return
+            state = self.states[game_id]
+            diff = {k: v for k, v in changes.items() if k not in state or state[k] != v}
+            if not diff:
+                return
+            state.update(diff)
+            for q in subscribers:
+                q.put(diff)
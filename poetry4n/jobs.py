@@ -0,0 +1,65 @@
+"""Background admin jobs with pollable progress."""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import threading
+import uuid
+
+# Finished jobs kept around for status polling
+MAX_FINISHED_JOBS = 50
+
+
+class AdminJobs:
+    """Runs admin operations off the request thread, one at a time.
+
+    A job's function is called as fn(progress=callback) and reports the number
+    of documents processed so far through the callback.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='admin-job')
+        self.jobs = {}  # job_id -> status dict, in creation order
+
+    def start(self, kind, fn):
+        job_id = str(uuid.uuid4())
+        job = {
+            'job_id': job_id,
+            'kind': kind,
+            'state': 'queued',  # queued, running, done, failed
+            'processed': 0,
+            'startedAt': None,
+            'finishedAt': None,
+            'error': None
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+            self._forget_old()
+            snapshot = dict(job)
+        self.executor.submit(self._run, job, fn)
+        return snapshot
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job, **fields):
+        with self.lock:
+            job.update(fields)
+
+    def _run(self, job, fn):
+        self._update(job, state='running', startedAt=datetime.utcnow())
+        try:
+            fn(progress=lambda n: self._update(job, processed=n))
+        except Exception as e:
+            logging.exception('Admin job %s (%s) failed', job['job_id'], job['kind'])
+            self._update(job, state='failed', error=str(e), finishedAt=datetime.utcnow())
+        else:
+            self._update(job, state='done', finishedAt=datetime.utcnow())
+
+    def _forget_old(self):
+        # Caller holds self.lock
+        finished = [job_id for job_id, job in self.jobs.items() if job['state'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
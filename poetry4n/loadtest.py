@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Load generator for poetry4n.
+
+Plays N concurrent games through the real routes (create_game, add_player,
+start_game, ready_turn, assign_points, end_turn) and reports throughput and
+p50/p95/p99 latency per endpoint.
+
+By default the Flask app runs in-process on the memory storage backend, so
+no cloud access is needed. Pass --url to drive a running server instead.
+
+    python loadtest.py --games 50 --players 4 --turns 4 --points 5
+    python loadtest.py --url http://localhost:8080 --games 10
+"""
+import argparse
+from collections import defaultdict
+import json
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+class LocalClient:
+    """Calls the app in-process through Flask's test client."""
+
+    def __init__(self):
+        os.environ.setdefault('POETRY4N_STORAGE', 'memory')
+        import app
+        self.app = app.app
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'X-Session-Token': token} if token else {}
+        # One test client per call keeps threads from sharing cookie state
+        res = self.app.test_client().open(path, method=method, json=body, headers=headers)
+        return res.status_code, res.get_json(silent=True) or {}
+
+
+class HttpClient:
+    """Calls a running server over HTTP."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['X-Session-Token'] = token
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as res:
+                return res.status, json.loads(res.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            return e.code, {}
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.errors = defaultdict(int)
+
+    def timed(self, client, endpoint, method, path, body=None, token=None):
+        start = time.perf_counter()
+        status, data = client.request(method, path, body, token)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if status >= 400:
+                self.errors[endpoint] += 1
+        return status, data
+
+
+def percentile(sorted_values, p):
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def play_game(client, stats, n_players, n_turns, n_points):
+    """Play one game: create, join, start, then n_turns turns of n_points scores each."""
+    _, data = stats.timed(client, 'create_game', 'POST', '/create_game')
+    game_id = data['game_id']
+    tokens = {}  # player_id -> (token, team)
+    for i in range(n_players):
+        team = 'AB'[i % 2]
+        _, data = stats.timed(client, 'add_player', 'POST', '/add_player',
+                              {'game_id': game_id, 'player_name': f'player{i}', 'team': team})
+        tokens[data['player_id']] = (data['session_token'], team)
+    stats.timed(client, 'start_game', 'POST', '/start_game', {'game_id': game_id})
+
+    for _ in range(n_turns):
+        _, game = stats.timed(client, 'get_game', 'GET', f'/get_game/{game_id}')
+        current = game.get('currentTurn')
+        if current not in tokens:
+            return
+        token, team = tokens[current]
+        # Someone from the other team does the scoring
+        scorer = next(t for t, tm in tokens.values() if tm != team)
+        stats.timed(client, 'ready_turn', 'POST', '/ready_turn', token=token)
+        for _ in range(n_points):
+            stats.timed(client, 'assign_points', 'POST', '/assign_points', {'points': 1, 'team': team}, token=scorer)
+        stats.timed(client, 'end_turn', 'POST', '/end_turn', token=token)
+
+
+def report(stats, wall_time):
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f"{total} requests in {wall_time:.2f}s ({total / wall_time:.1f} req/s)")
+    print(f"{'endpoint':<15}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, values in sorted(stats.latencies.items()):
+        values = sorted(values)
+        print(f"{endpoint:<15}{len(values):>8}{stats.errors[endpoint]:>8}"
+              f"{percentile(values, 50) * 1000:>10.2f}{percentile(values, 95) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test poetry4n with concurrent games')
+    parser.add_argument('--games', type=int, default=20, help='concurrent games')
+    parser.add_argument('--players', type=int, default=4, help='players per game (at least 4)')
+    parser.add_argument('--turns', type=int, default=4, help='turns played per game')
+    parser.add_argument('--points', type=int, default=5, help='assign_points calls per turn')
+    parser.add_argument('--url', help='base URL of a running server (default: in-process, memory storage)')
+    args = parser.parse_args()
+    if args.players < 4:
+        parser.error('a game needs at least 4 players')
+
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        client = LocalClient()
+        # Enough phrases that every score gets a fresh one
+        import db_funcs
+        needed = args.games * args.turns * (args.points + 2)
+        db_funcs.engine.add_phrases([{'text': f'Load Phrase{i}', 'word': f'Phrase{i}'} for i in range(needed)])
+
+    stats = Stats()
+    barrier = threading.Barrier(args.games)
+
+    def run():
+        barrier.wait()
+        play_game(client, stats, args.players, args.turns, args.points)
+
+    threads = [threading.Thread(target=run) for _ in range(args.games)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    report(stats, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
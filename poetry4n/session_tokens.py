@@ -0,0 +1,29 @@
+"""Stateless signed session tokens.
+
+A token carries the player_id and game_id it was issued for and is signed
+with the app's secret key, so any worker or instance sharing that key can
+verify it without a shared session store.
+"""
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Tokens older than this are rejected
+TOKEN_MAX_AGE = 24 * 60 * 60
+
+
+class SessionTokens:
+    def __init__(self, secret_key, salt, max_age=TOKEN_MAX_AGE):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt=salt)
+        self.max_age = max_age
+
+    def issue(self, player_id, game_id):
+        return self.serializer.dumps({
+            'player_id': player_id,
+            'game_id': game_id
+        })
+
+    def verify(self, token):
+        """Return the token's {'player_id', 'game_id'}, or None if invalid or expired."""
+        try:
+            return self.serializer.loads(token, max_age=self.max_age)
+        except BadSignature:
+            return None
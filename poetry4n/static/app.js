@@ -4,6 +4,8 @@ let sessionToken = null;
 let currentTeam = null;
 let timerInterval = null;
 let playerTeam = null;
+let gameState = null;
+let gameEvents = null;
 
 function show(id) {
     document.getElementById(id).style.display = '';
@@ -130,10 +132,31 @@ async function joinGame() {
     show('game');
     updateTeamIndicator();
     document.getElementById('gameSelect').dispatchEvent(new Event('change'));
-    pollGameState();
+    watchGameState();
     joinBtn.disabled = false;
 }
 
+// Subscribe to server-sent game updates; fall back to polling without EventSource
+function watchGameState() {
+    if (!gameId) return;
+    if (!window.EventSource) {
+        pollGameState();
+        return;
+    }
+    if (gameEvents) gameEvents.close();
+    gameEvents = new EventSource(`/games/${gameId}/events`);
+    // Full state on every (re)connect, then only the fields that changed
+    gameEvents.addEventListener('state', e => {
+        gameState = JSON.parse(e.data);
+        renderGame(gameState);
+    });
+    gameEvents.onmessage = e => {
+        if (!gameState) return;
+        Object.assign(gameState, JSON.parse(e.data));
+        renderGame(gameState);
+    };
+}
+
 async function pollGameState() {
     if (!gameId) return;
     const res = await fetch(`/get_game/${gameId}`);
@@ -142,6 +165,11 @@ async function pollGameState() {
         setGameInfo('Game not found.');
         return;
     }
+    renderGame(game);
+    setTimeout(pollGameState, 2000);
+}
+
+function renderGame(game) {
     setGameInfo(`Team A: ${game.scores.A} | Team B: ${game.scores.B}`);
     currentTeam = game.currentTeam || 'A';
     const isActive = game.currentTurn === playerId;
@@ -191,7 +219,6 @@ async function pollGameState() {
         hide('turn');
         show('waiting');
     }
-    setTimeout(pollGameState, 2000);
 }
 
 function startTimer(turnEndTime) {
@@ -0,0 +1,913 @@
+"""Storage engines for poetry4n game state.
+
+db_funcs talks to one of these through the StorageEngine interface. The
+backend is picked with the POETRY4N_STORAGE environment variable:
+
+    firestore  - Google Cloud Firestore (default, needs service-account.json)
+    memory     - process-local dicts, for single-instance runs and load tests
+    sqlite     - a local SQLite file (POETRY4N_SQLITE_PATH, default poetry4n.db)
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import random
+import sqlite3
+import threading
+import uuid
+
+FIRESTORE_PROJECT = 'torch-3'
+CREDENTIALS_PATH = 'service-account.json'
+# How many times to retry when another game claims our phrase first
+PHRASE_CLAIM_ATTEMPTS = 5
+# Bulk admin operations: documents per page/batch (Firestore's batch limit) and batches in flight
+BULK_PAGE_SIZE = 500
+BULK_WORKERS = 4
+# Compaction: lobbies nobody started are deleted after LOBBY_EXPIRY, other games
+# are archived and deleted once nothing has happened in them for GAME_TTL
+LOBBY_EXPIRY = timedelta(hours=2)
+GAME_TTL = timedelta(days=1)
+
+
+def new_game_doc():
+    """Initial document for a freshly created game."""
+    return {
+        'state': 'waiting',
+        'createdAt': datetime.utcnow(),
+        'scores': {'A': 0, 'B': 0},
+        'teamA': [],
+        'teamB': [],
+        'round': 1
+    }
+
+
+def turn_expired(turn_end_time):
+    """True if turnEndTime (a datetime or ISO string, in UTC) has passed."""
+    if not turn_end_time:
+        return False
+    if isinstance(turn_end_time, str):
+        try:
+            turn_end_time = datetime.fromisoformat(turn_end_time.replace('Z', '+00:00'))
+        except ValueError:
+            return False
+    now = datetime.utcnow().replace(tzinfo=turn_end_time.tzinfo)
+    return now > turn_end_time
+
+
+def turn_over(game):
+    """True unless a turn is running: readied, with a timer that hasn't passed.
+
+    A turn the server has already passed on (turnReady false, no turnEndTime)
+    counts as over, so a click that arrives late can't start the next one.
+    """
+    turn_end_time = game.get('turnEndTime')
+    return not game.get('turnReady') or not turn_end_time or turn_expired(turn_end_time)
+
+
+def _naive_utc(when):
+    # Firestore returns aware datetimes, the other backends naive UTC ones
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def compaction_action(game, now):
+    """'expire' for a lobby past LOBBY_EXPIRY, 'archive' for a game idle past GAME_TTL, else None."""
+    created = game.get('createdAt')
+    if not isinstance(created, datetime):
+        return None
+    created = _naive_utc(created)
+    if game.get('state') == 'waiting':
+        return 'expire' if now - created > LOBBY_EXPIRY else None
+    last_activity = created
+    turn_end = game.get('turnEndTime')
+    if isinstance(turn_end, datetime):
+        last_activity = max(last_activity, _naive_utc(turn_end))
+    return 'archive' if now - last_activity > GAME_TTL else None
+
+
+def archive_doc(game, players, now):
+    """Compact cold-storage record of a game: when it ran, the final score and who played.
+
+    players is an iterable of (name, team).
+    """
+    teams = {'A': [], 'B': []}
+    for name, team in players:
+        teams.setdefault(team, []).append(name)
+    return {
+        'createdAt': game.get('createdAt'),
+        'archivedAt': now,
+        'rounds': game.get('round', 1),
+        'scores': dict(game.get('scores', {})),
+        'teams': teams
+    }
+
+
+def same_instant(a, b):
+    """True if two turnEndTime values (datetimes or ISO strings, UTC) are the same moment."""
+    def as_utc(value):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+    if not a or not b:
+        return a == b
+    return as_utc(a) == as_utc(b)
+
+
+def next_turn_updates(game):
+    """Updates that pass the turn to the next player of the other team, or None if it has no players."""
+    current_team = game.get('currentTeam', 'A')
+    next_team = 'B' if current_team == 'A' else 'A'
+    team_players = game.get(f'team{next_team}', [])
+    if not team_players:
+        return None
+    # Get last index for next team
+    last_index_key = f'lastPlayerIndex{next_team}'
+    next_idx = (game.get(last_index_key, -1) + 1) % len(team_players)
+    # Set state to waiting for ready and update last index
+    return {
+        'currentTeam': next_team,
+        'currentTurn': team_players[next_idx],
+        'turnReady': False,
+        'currentPhrase': None,
+        'currentWord': None,
+        'turnEndTime': None,
+        last_index_key: next_idx
+    }
+
+
+class PhraseTaken(Exception):
+    """Raised inside a transaction when the candidate phrase was claimed by another game."""
+
+
+class StorageEngine:
+    """Interface every storage backend implements."""
+
+    def create_game(self):
+        raise NotImplementedError
+
+    def add_player(self, game_id, player_name, team):
+        raise NotImplementedError
+
+    def get_game(self, game_id):
+        raise NotImplementedError
+
+    def update_game_state(self, game_id, updates):
+        raise NotImplementedError
+
+    def transform_game(self, game_id, fn):
+        """Atomically read the game, compute updates = fn(game) and apply them.
+
+        fn may return None to leave the game unchanged, and may be called more
+        than once if the backend retries. Returns (game, updates), with game
+        None if it doesn't exist.
+        """
+        raise NotImplementedError
+
+    def get_random_phrase(self):
+        raise NotImplementedError
+
+    def assign_points(self, game_id, team, points):
+        """Add points to a team and, unless the turn is over, swap in the next phrase.
+
+        Done as one atomic commit. Points that arrive after the turn is over (see
+        turn_over) still count, for the phrase that was showing at the buzzer, but
+        no phrase is claimed. Returns None if the game doesn't exist, otherwise
+        {'scores': ..., 'expired': bool, 'phrase': {'text', 'word'} or None}.
+        """
+        raise NotImplementedError
+
+    def list_waiting_games(self):
+        raise NotImplementedError
+
+    def reset_all_phrases(self, progress=None):
+        """Mark every phrase unused. progress(n) is called with the running count of writes."""
+        raise NotImplementedError
+
+    def delete_all_games(self, progress=None):
+        """Delete every game and its players. progress(n) is called with the running count of deletes."""
+        raise NotImplementedError
+
+    def compact_games(self, now=None, progress=None):
+        """Delete expired lobbies, and archive then delete idle games (see compaction_action).
+
+        Players go with their game. Returns the number of games removed;
+        progress(n) is called with the running count of document writes.
+        """
+        raise NotImplementedError
+
+    def get_player_name(self, game_id, player_id):
+        raise NotImplementedError
+
+    def add_phrases(self, phrases):
+        """Store phrase dicts ({'text', 'word'}) as unused phrases."""
+        raise NotImplementedError
+
+    def watch_game(self, game_id, callback):
+        """Call callback(game) when another process changes the game.
+
+        Returns a function that stops watching, or None if the backend has no
+        cross-process change feed (local writes are published by db_funcs).
+        """
+        return None
+
+
+class FirestoreStorage(StorageEngine):
+    def __init__(self, project=FIRESTORE_PROJECT, credentials_path=CREDENTIALS_PATH):
+        from google.cloud import firestore
+        from google.oauth2 import service_account
+        self.firestore = firestore
+        self.db = firestore.Client(
+            project=project,
+            credentials=service_account.Credentials.from_service_account_file(credentials_path)
+        )
+
+    def create_game(self):
+        game_id = str(uuid.uuid4())
+        self.db.collection('games').document(game_id).set(new_game_doc())
+        return game_id
+
+    def add_player(self, game_id, player_name, team):
+        # Prevent duplicate players (same name and team in the same game)
+        players_ref = self.db.collection('games').document(game_id).collection('players')
+        existing_players = list(players_ref.where('name', '==', player_name).where('team', '==', team).stream())
+        if existing_players:
+            # Return the first matching player's ID
+            return existing_players[0].id
+        player_id = str(uuid.uuid4())
+        players_ref.document(player_id).set({
+            'name': player_name,
+            'team': team,
+            'joinedAt': datetime.utcnow()
+        })
+        # Add player to team array in game doc
+        game_ref = self.db.collection('games').document(game_id)
+        game_ref.update({f'team{team}': self.firestore.ArrayUnion([player_id])})
+        return player_id
+
+    def get_game(self, game_id):
+        return self.db.collection('games').document(game_id).get().to_dict()
+
+    def update_game_state(self, game_id, updates):
+        self.db.collection('games').document(game_id).update(updates)
+
+    def transform_game(self, game_id, fn):
+        game_ref = self.db.collection('games').document(game_id)
+
+        @self.firestore.transactional
+        def transform(transaction):
+            snapshot = game_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None, None
+            game = snapshot.to_dict()
+            updates = fn(game)
+            if updates:
+                transaction.update(game_ref, updates)
+            return game, updates
+
+        return transform(self.db.transaction())
+
+    def watch_game(self, game_id, callback):
+        # Snapshot listener so changes written by other instances reach our streams
+        def on_snapshot(snapshots, changes, read_time):
+            for snapshot in snapshots:
+                if snapshot.exists:
+                    callback(snapshot.to_dict())
+        watch = self.db.collection('games').document(game_id).on_snapshot(on_snapshot)
+        return watch.unsubscribe
+
+    def _random_unused_phrase(self):
+        """Return one unused phrase snapshot near a random point of the rand index."""
+        phrases = self.db.collection('phrases').where('used', '==', False)
+        pivot = random.random()
+        for query in (
+            phrases.where('rand', '>=', pivot).order_by('rand'),
+            phrases.where('rand', '<', pivot).order_by('rand'),
+            phrases,  # documents uploaded before the rand field existed
+        ):
+            docs = list(query.limit(1).stream())
+            if docs:
+                return docs[0]
+        return None
+
+    def get_random_phrase(self):
+        firestore = self.firestore
+
+        @firestore.transactional
+        def claim(transaction, ref):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists or snapshot.get('used'):
+                return None
+            # Re-key the claimed phrase so it lands somewhere new once reset
+            transaction.update(ref, {'used': True, 'rand': random.random()})
+            return snapshot.to_dict()
+
+        for _ in range(PHRASE_CLAIM_ATTEMPTS):
+            phrase_doc = self._random_unused_phrase()
+            if phrase_doc is None:
+                return None
+            data = claim(self.db.transaction(), phrase_doc.reference)
+            if data:
+                return {'text': data['text'], 'word': data['word']}
+        return None
+
+    def assign_points(self, game_id, team, points):
+        firestore = self.firestore
+        game_ref = self.db.collection('games').document(game_id)
+
+        @firestore.transactional
+        def score(transaction, phrase_ref):
+            game_snapshot = game_ref.get(transaction=transaction)
+            if not game_snapshot.exists:
+                return None
+            game = game_snapshot.to_dict()
+            scores = game.get('scores', {'A': 0, 'B': 0})
+            scores[team] = scores.get(team, 0) + points
+            result = {'scores': scores, 'expired': turn_over(game), 'phrase': None}
+            updates = {f'scores.{team}': scores[team]}
+            if not result['expired'] and phrase_ref is not None:
+                phrase_snapshot = phrase_ref.get(transaction=transaction)
+                if not phrase_snapshot.exists or phrase_snapshot.get('used'):
+                    raise PhraseTaken()
+                phrase = phrase_snapshot.to_dict()
+                result['phrase'] = {'text': phrase['text'], 'word': phrase['word']}
+                updates['currentPhrase'] = phrase['text']
+                updates['currentWord'] = phrase['word']
+                transaction.update(phrase_ref, {'used': True, 'rand': random.random()})
+            transaction.update(game_ref, updates)
+            return result
+
+        for _ in range(PHRASE_CLAIM_ATTEMPTS):
+            phrase_doc = self._random_unused_phrase()
+            try:
+                return score(self.db.transaction(), phrase_doc.reference if phrase_doc else None)
+            except PhraseTaken:
+                continue
+        # Every candidate was taken under us; score without a new phrase
+        return score(self.db.transaction(), None)
+
+    def list_waiting_games(self):
+        # Only the team arrays are needed to count players
+        games = self.db.collection('games').where('state', '==', 'waiting').select(['createdAt', 'teamA', 'teamB']).stream()
+        result = []
+        for g in games:
+            data = g.to_dict()
+            result.append({
+                'game_id': g.id,
+                'createdAt': data.get('createdAt'),
+                'teamA': data.get('teamA', []),
+                'teamB': data.get('teamB', [])
+            })
+        return result
+
+    def _pages(self, query, order_by='__name__'):
+        """Yield a query's results a page at a time, paginating on order_by (document id by default)."""
+        query = query.order_by(order_by).limit(BULK_PAGE_SIZE)
+        last = None
+        while True:
+            page = list((query.start_after(last) if last else query).stream())
+            if not page:
+                return
+            yield page
+            if len(page) < BULK_PAGE_SIZE:
+                return
+            last = page[-1]
+
+    def _commit_in_batches(self, ref_chunks, write, progress):
+        """Commit one batch per chunk of refs, at most BULK_WORKERS in flight."""
+        done = 0
+        pending = set()
+
+        def commit(batch, n):
+            batch.commit()
+            return n
+
+        def collect(finished):
+            nonlocal done
+            for future in finished:
+                done += future.result()
+            if progress:
+                progress(done)
+
+        with ThreadPoolExecutor(max_workers=BULK_WORKERS) as pool:
+            for refs in ref_chunks:
+                batch = self.db.batch()
+                for ref in refs:
+                    write(batch, ref)
+                pending.add(pool.submit(commit, batch, len(refs)))
+                if len(pending) >= BULK_WORKERS:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+            collect(wait(pending).done)
+        return done
+
+    def reset_all_phrases(self, progress=None):
+        # Only phrases that are actually used need a write
+        used = self.db.collection('phrases').where('used', '==', True).select(['used'])
+        chunks = ([doc.reference for doc in page] for page in self._pages(used))
+        return self._commit_in_batches(chunks, lambda batch, ref: batch.update(ref, {'used': False}), progress)
+
+    def delete_all_games(self, progress=None):
+        def chunks():
+            refs = []
+            for page in self._pages(self.db.collection('games').select(['state'])):
+                for game in page:
+                    # Player docs are deleted with their game; list_documents reads no contents
+                    refs.extend(game.reference.collection('players').list_documents())
+                    refs.append(game.reference)
+                while len(refs) >= BULK_PAGE_SIZE:
+                    yield refs[:BULK_PAGE_SIZE]
+                    refs = refs[BULK_PAGE_SIZE:]
+            if refs:
+                yield refs
+        return self._commit_in_batches(chunks(), lambda batch, ref: batch.delete(ref), progress)
+
+    def compact_games(self, now=None, progress=None):
+        now = now or datetime.utcnow()
+        removed = 0
+
+        def game_writes(game_ref, game):
+            # (ref, archive doc or None to delete) for one game, players first
+            if compaction_action(game, now) == 'expire':
+                writes = [(ref, None) for ref in game_ref.collection('players').list_documents()]
+            else:
+                players = list(game_ref.collection('players').select(['name', 'team']).stream())
+                archive = archive_doc(game, ((p.get('name'), p.get('team')) for p in players), now)
+                writes = [(p.reference, None) for p in players]
+                writes.append((self.db.collection('games_archive').document(game_ref.id), archive))
+            writes.append((game_ref, None))
+            return writes
+
+        def chunks():
+            nonlocal removed
+            # Every candidate was created before the shorter TTL. Whiteboard games
+            # share this collection but have no createdAt, so the query skips them.
+            candidates = (self.db.collection('games')
+                          .where('createdAt', '<', now - min(LOBBY_EXPIRY, GAME_TTL))
+                          .select(['state', 'createdAt', 'turnEndTime', 'round', 'scores']))
+            writes = []
+            for page in self._pages(candidates, order_by='createdAt'):
+                for game in page:
+                    data = game.to_dict()
+                    if not compaction_action(data, now):
+                        continue
+                    group = game_writes(game.reference, data)
+                    # Keep a game's archive and deletes in one batch so it's never half-removed
+                    if len(writes) + len(group) > BULK_PAGE_SIZE:
+                        yield writes
+                        writes = []
+                    writes.extend(group)
+                    removed += 1
+            if writes:
+                yield writes
+
+        def write(batch, item):
+            ref, archive = item
+            if archive is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, archive)
+
+        self._commit_in_batches(chunks(), write, progress)
+        return removed
+
+    def get_player_name(self, game_id, player_id):
+        player_ref = self.db.collection('games').document(game_id).collection('players').document(player_id)
+        player_doc = player_ref.get()
+        if player_doc.exists:
+            return player_doc.to_dict().get('name')
+        return None
+
+    def add_phrases(self, phrases):
+        batch = self.db.batch()
+        for i, phrase in enumerate(phrases):
+            batch.set(self.db.collection('phrases').document(), {
+                'text': phrase['text'],
+                'word': phrase['word'],
+                'used': False,
+                'rand': random.random()
+            })
+            # Firestore batches are capped at 500 writes
+            if (i + 1) % 500 == 0:
+                batch.commit()
+                batch = self.db.batch()
+        batch.commit()
+
+
+class MemoryStorage(StorageEngine):
+    """Keeps everything in process memory. State is lost on restart."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.games = {}
+        self.players = {}  # game_id -> {player_id: player doc}
+        self.phrases = {}  # phrase_id -> phrase doc
+        self.unused = []   # ids of unused phrases, in no particular order
+        self.archive = {}  # game_id -> archive doc of a compacted game
+
+    def create_game(self):
+        game_id = str(uuid.uuid4())
+        with self.lock:
+            self.games[game_id] = new_game_doc()
+            self.players[game_id] = {}
+        return game_id
+
+    def add_player(self, game_id, player_name, team):
+        with self.lock:
+            players = self.players.setdefault(game_id, {})
+            for player_id, player in players.items():
+                if player['name'] == player_name and player['team'] == team:
+                    return player_id
+            player_id = str(uuid.uuid4())
+            players[player_id] = {
+                'name': player_name,
+                'team': team,
+                'joinedAt': datetime.utcnow()
+            }
+            game = self.games.get(game_id)
+            if game is not None:
+                team_ids = game.setdefault(f'team{team}', [])
+                if player_id not in team_ids:
+                    team_ids.append(player_id)
+        return player_id
+
+    def get_game(self, game_id):
+        with self.lock:
+            game = self.games.get(game_id)
+            return copy_doc(game) if game is not None else None
+
+    def update_game_state(self, game_id, updates):
+        with self.lock:
+            if game_id not in self.games:
+                raise KeyError(f'No game {game_id}')
+            self.games[game_id].update(copy_doc(updates))
+
+    def transform_game(self, game_id, fn):
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None:
+                return None, None
+            updates = fn(copy_doc(game))
+            if updates:
+                game.update(copy_doc(updates))
+            return copy_doc(game), updates
+
+    def _claim_phrase(self):
+        # Caller holds self.lock
+        if not self.unused:
+            return None
+        # Swap a random id to the end and pop it: O(1) claim
+        i = random.randrange(len(self.unused))
+        self.unused[i], self.unused[-1] = self.unused[-1], self.unused[i]
+        phrase = self.phrases[self.unused.pop()]
+        phrase['used'] = True
+        return {'text': phrase['text'], 'word': phrase['word']}
+
+    def get_random_phrase(self):
+        with self.lock:
+            return self._claim_phrase()
+
+    def assign_points(self, game_id, team, points):
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None:
+                return None
+            scores = game.setdefault('scores', {'A': 0, 'B': 0})
+            scores[team] = scores.get(team, 0) + points
+            result = {'scores': dict(scores), 'expired': turn_over(game), 'phrase': None}
+            if not result['expired']:
+                result['phrase'] = self._claim_phrase()
+                if result['phrase']:
+                    game['currentPhrase'] = result['phrase']['text']
+                    game['currentWord'] = result['phrase']['word']
+            return result
+
+    def list_waiting_games(self):
+        with self.lock:
+            return [{
+                'game_id': game_id,
+                'createdAt': game.get('createdAt'),
+                'teamA': list(game.get('teamA', [])),
+                'teamB': list(game.get('teamB', []))
+            } for game_id, game in self.games.items() if game.get('state') == 'waiting']
+
+    def reset_all_phrases(self, progress=None):
+        with self.lock:
+            count = len(self.phrases) - len(self.unused)
+            for phrase in self.phrases.values():
+                phrase['used'] = False
+            self.unused = list(self.phrases)
+        if progress:
+            progress(count)
+        return count
+
+    def delete_all_games(self, progress=None):
+        with self.lock:
+            count = len(self.games) + sum(len(p) for p in self.players.values())
+            self.games.clear()
+            self.players.clear()
+        if progress:
+            progress(count)
+        return count
+
+    def compact_games(self, now=None, progress=None):
+        now = now or datetime.utcnow()
+        removed = writes = 0
+        with self.lock:
+            for game_id, game in list(self.games.items()):
+                action = compaction_action(game, now)
+                if not action:
+                    continue
+                players = self.players.pop(game_id, {})
+                if action == 'archive':
+                    self.archive[game_id] = archive_doc(
+                        game, ((p['name'], p['team']) for p in players.values()), now)
+                    writes += 1
+                del self.games[game_id]
+                removed += 1
+                writes += len(players) + 1
+        if progress:
+            progress(writes)
+        return removed
+
+    def get_player_name(self, game_id, player_id):
+        with self.lock:
+            player = self.players.get(game_id, {}).get(player_id)
+            return player['name'] if player else None
+
+    def add_phrases(self, phrases):
+        with self.lock:
+            for phrase in phrases:
+                phrase_id = str(uuid.uuid4())
+                self.phrases[phrase_id] = {
+                    'text': phrase['text'],
+                    'word': phrase['word'],
+                    'used': False
+                }
+                self.unused.append(phrase_id)
+
+
+class SQLiteStorage(StorageEngine):
+    """Stores game documents as JSON rows in a local SQLite database."""
+
+    def __init__(self, path='poetry4n.db'):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS games (
+                    id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS games_state ON games (state);
+                CREATE TABLE IF NOT EXISTS players (
+                    id TEXT PRIMARY KEY,
+                    game_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    team TEXT NOT NULL,
+                    joined_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS players_game ON players (game_id, name, team);
+                CREATE TABLE IF NOT EXISTS phrases (
+                    id TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    word TEXT NOT NULL,
+                    used INTEGER NOT NULL DEFAULT 0,
+                    rand REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS games_archive (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+            ''')
+            self._add_phrase_rand()
+            self.conn.execute('CREATE INDEX IF NOT EXISTS phrases_used_rand ON phrases (used, rand)')
+
+    def _add_phrase_rand(self):
+        # Databases created before the rand index have no rand column; add it
+        # and give every existing phrase its random key
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(phrases)')]
+        if 'rand' in columns:
+            return
+        self.conn.execute('ALTER TABLE phrases ADD COLUMN rand REAL NOT NULL DEFAULT 0')
+        ids = [row[0] for row in self.conn.execute('SELECT id FROM phrases')]
+        self.conn.executemany('UPDATE phrases SET rand = ? WHERE id = ?',
+                              [(random.random(), phrase_id) for phrase_id in ids])
+
+    def _load_game(self, game_id):
+        row = self.conn.execute('SELECT data FROM games WHERE id = ?', (game_id,)).fetchone()
+        return loads_doc(row[0]) if row else None
+
+    def _save_game(self, game_id, game):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO games (id, state, data) VALUES (?, ?, ?)',
+            (game_id, game.get('state', ''), dumps_doc(game))
+        )
+
+    def create_game(self):
+        game_id = str(uuid.uuid4())
+        with self.lock, self.conn:
+            self._save_game(game_id, new_game_doc())
+        return game_id
+
+    def add_player(self, game_id, player_name, team):
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                'SELECT id FROM players WHERE game_id = ? AND name = ? AND team = ? LIMIT 1',
+                (game_id, player_name, team)
+            ).fetchone()
+            if row:
+                return row[0]
+            player_id = str(uuid.uuid4())
+            self.conn.execute(
+                'INSERT INTO players (id, game_id, name, team, joined_at) VALUES (?, ?, ?, ?, ?)',
+                (player_id, game_id, player_name, team, datetime.utcnow().isoformat())
+            )
+            game = self._load_game(game_id)
+            if game is not None:
+                team_ids = game.setdefault(f'team{team}', [])
+                if player_id not in team_ids:
+                    team_ids.append(player_id)
+                self._save_game(game_id, game)
+        return player_id
+
+    def get_game(self, game_id):
+        with self.lock:
+            return self._load_game(game_id)
+
+    def update_game_state(self, game_id, updates):
+        with self.lock, self.conn:
+            game = self._load_game(game_id)
+            if game is None:
+                raise KeyError(f'No game {game_id}')
+            game.update(updates)
+            self._save_game(game_id, game)
+
+    def transform_game(self, game_id, fn):
+        with self.lock, self.conn:
+            game = self._load_game(game_id)
+            if game is None:
+                return None, None
+            updates = fn(loads_doc(dumps_doc(game)))
+            if updates:
+                game.update(updates)
+                self._save_game(game_id, game)
+            return game, updates
+
+    def _claim_phrase(self):
+        # Caller holds self.lock inside a transaction
+        pivot = random.random()
+        row = self.conn.execute(
+            'SELECT id, text, word FROM phrases WHERE used = 0 AND rand >= ? ORDER BY rand LIMIT 1',
+            (pivot,)
+        ).fetchone() or self.conn.execute(
+            'SELECT id, text, word FROM phrases WHERE used = 0 AND rand < ? ORDER BY rand LIMIT 1',
+            (pivot,)
+        ).fetchone()
+        if not row:
+            return None
+        self.conn.execute('UPDATE phrases SET used = 1, rand = ? WHERE id = ?', (random.random(), row[0]))
+        return {'text': row[1], 'word': row[2]}
+
+    def get_random_phrase(self):
+        with self.lock, self.conn:
+            return self._claim_phrase()
+
+    def assign_points(self, game_id, team, points):
+        with self.lock, self.conn:
+            game = self._load_game(game_id)
+            if game is None:
+                return None
+            scores = game.setdefault('scores', {'A': 0, 'B': 0})
+            scores[team] = scores.get(team, 0) + points
+            result = {'scores': dict(scores), 'expired': turn_over(game), 'phrase': None}
+            if not result['expired']:
+                result['phrase'] = self._claim_phrase()
+                if result['phrase']:
+                    game['currentPhrase'] = result['phrase']['text']
+                    game['currentWord'] = result['phrase']['word']
+            self._save_game(game_id, game)
+            return result
+
+    def list_waiting_games(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT id, data FROM games WHERE state = 'waiting'").fetchall()
+        result = []
+        for game_id, data in rows:
+            game = loads_doc(data)
+            result.append({
+                'game_id': game_id,
+                'createdAt': game.get('createdAt'),
+                'teamA': game.get('teamA', []),
+                'teamB': game.get('teamB', [])
+            })
+        return result
+
+    def reset_all_phrases(self, progress=None):
+        with self.lock, self.conn:
+            count = self.conn.execute('UPDATE phrases SET used = 0 WHERE used = 1').rowcount
+        if progress:
+            progress(count)
+        return count
+
+    def delete_all_games(self, progress=None):
+        with self.lock, self.conn:
+            count = self.conn.execute('DELETE FROM players').rowcount
+            count += self.conn.execute('DELETE FROM games').rowcount
+        if progress:
+            progress(count)
+        return count
+
+    def compact_games(self, now=None, progress=None):
+        now = now or datetime.utcnow()
+        removed = writes = 0
+        with self.lock, self.conn:
+            for game_id, data in self.conn.execute('SELECT id, data FROM games').fetchall():
+                game = loads_doc(data)
+                action = compaction_action(game, now)
+                if not action:
+                    continue
+                if action == 'archive':
+                    players = self.conn.execute(
+                        'SELECT name, team FROM players WHERE game_id = ?', (game_id,)
+                    ).fetchall()
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO games_archive (id, data) VALUES (?, ?)',
+                        (game_id, dumps_doc(archive_doc(game, players, now)))
+                    )
+                    writes += 1
+                writes += self.conn.execute('DELETE FROM players WHERE game_id = ?', (game_id,)).rowcount
+                writes += self.conn.execute('DELETE FROM games WHERE id = ?', (game_id,)).rowcount
+                removed += 1
+        if progress:
+            progress(writes)
+        return removed
+
+    def get_player_name(self, game_id, player_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT name FROM players WHERE id = ? AND game_id = ?', (player_id, game_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add_phrases(self, phrases):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO phrases (id, text, word, used, rand) VALUES (?, ?, ?, 0, ?)',
+                [(str(uuid.uuid4()), p['text'], p['word'], random.random()) for p in phrases]
+            )
+
+
+def copy_doc(doc):
+    """Copy a game document so callers can't mutate stored state."""
+    return {k: (copy_doc(v) if isinstance(v, dict) else list(v) if isinstance(v, list) else v)
+            for k, v in doc.items()}
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f'Cannot store {type(value).__name__} in a game document')
+
+
+def _decode_value(obj):
+    if set(obj) == {'$dt'}:
+        return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+def dumps_doc(doc):
+    return json.dumps(doc, default=_encode_value)
+
+
+def loads_doc(data):
+    return json.loads(data, object_hook=_decode_value)
+
+
+def get_storage(backend=None):
+    """Build the storage engine named by backend or POETRY4N_STORAGE."""
+    backend = backend or os.environ.get('POETRY4N_STORAGE', 'firestore')
+    if backend == 'firestore':
+        return FirestoreStorage()
+    if backend == 'memory':
+        engine = MemoryStorage()
+    elif backend == 'sqlite':
+        engine = SQLiteStorage(os.environ.get('POETRY4N_SQLITE_PATH', 'poetry4n.db'))
+    else:
+        raise ValueError(f'Unknown storage backend: {backend}')
+    if os.environ.get('POETRY4N_SEED_PHRASES', '1') == '1':
+        seed_phrases(engine)
+    return engine
+
+
+def seed_phrases(engine):
+    """Load the built-in phrase list into an empty local engine."""
+    from upload_phrases import PHRASES, phrase_record
+    if isinstance(engine, SQLiteStorage):
+        with engine.lock:
+            if engine.conn.execute('SELECT 1 FROM phrases LIMIT 1').fetchone():
+                return
+    engine.add_phrases([r for r in map(phrase_record, PHRASES) if r])
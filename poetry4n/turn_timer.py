@@ -0,0 +1,76 @@
+"""Server-side enforcement of turn deadlines.
+
+One daemon thread sleeps until the earliest deadline in a heap and then calls
+the expiry callback, so thousands of games cost one thread and O(log n) per
+scheduled turn instead of a timer per game.
+"""
+from datetime import timezone
+import heapq
+import logging
+import threading
+import time
+
+
+def to_epoch(deadline):
+    """Seconds since the epoch for a datetime; naive datetimes are taken as UTC."""
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    return deadline.timestamp()
+
+
+class TurnScheduler:
+    def __init__(self, on_expire):
+        self.on_expire = on_expire  # called as on_expire(game_id, deadline)
+        self.cond = threading.Condition()
+        self.heap = []       # (epoch seconds, game_id), may hold stale entries
+        self.deadlines = {}  # game_id -> (epoch seconds, deadline) currently in force
+        self.thread = None
+
+    def schedule(self, game_id, deadline):
+        """Replace any pending deadline for the game with this one."""
+        when = to_epoch(deadline)
+        with self.cond:
+            self.deadlines[game_id] = (when, deadline)
+            heapq.heappush(self.heap, (when, game_id))
+            if self.thread is None:
+                # Started lazily so forked workers each get their own thread
+                self.thread = threading.Thread(target=self._run, name='turn-timer', daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def cancel(self, game_id):
+        with self.cond:
+            self.deadlines.pop(game_id, None)
+
+    def pending(self):
+        with self.cond:
+            return len(self.deadlines)
+
+    def _next_expired(self):
+        # Caller holds self.cond; blocks until a live deadline has passed
+        while True:
+            if not self.heap:
+                self.cond.wait()
+                continue
+            when, game_id = self.heap[0]
+            current = self.deadlines.get(game_id)
+            if current is None or current[0] != when:
+                # Cancelled or rescheduled since it was pushed
+                heapq.heappop(self.heap)
+                continue
+            delay = when - time.time()
+            if delay > 0:
+                self.cond.wait(delay)
+                continue
+            heapq.heappop(self.heap)
+            del self.deadlines[game_id]
+            return game_id, current[1]
+
+    def _run(self):
+        while True:
+            with self.cond:
+                game_id, deadline = self._next_expired()
+            try:
+                self.on_expire(game_id, deadline)
+            except Exception:
+                logging.exception('Failed to end expired turn for game %s', game_id)
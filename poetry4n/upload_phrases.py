@@ -1,10 +1,12 @@
+import argparse
+import hashlib
 import random
-from google.cloud import firestore
-from google.oauth2 import service_account
 
 # Update the path if your service account file is elsewhere
 CREDENTIALS_PATH = 'service-account.json'
 PROJECT_ID = 'torch-3'
+# Firestore allows up to 500 writes per batch
+BATCH_SIZE = 500
 
 # List of at least 100 two-word phrases
 PHRASES = [
@@ -53,39 +55,76 @@ PHRASES = [
     'Wolf Pack', 'Yacht Club', 'Zinc Plate'
 ]
 
+def phrase_record(phrase):
+    """Build the stored {'text', 'word'} record for a two-word phrase, or None if invalid."""
+    words = phrase.split()
+    if len(words) != 2:
+        return None
+    # Pick one word, deterministically
+    word = words[random.Random(phrase).randint(0, 1)]
+    return {'text': phrase, 'word': word}
+
+def phrase_id(record):
+    """Document ID derived from the phrase content, so unchanged phrases keep their doc."""
+    return hashlib.sha256(f"{record['text']}|{record['word']}".encode()).hexdigest()[:32]
+
+def diff_phrases(records, stored_ids):
+    """Compare wanted records with stored doc IDs. Returns (inserts {id: record}, deletes [id])."""
+    wanted = {phrase_id(record): record for record in records}
+    inserts = {pid: record for pid, record in wanted.items() if pid not in stored_ids}
+    deletes = sorted(set(stored_ids) - wanted.keys())
+    return inserts, deletes
+
 def main():
+    parser = argparse.ArgumentParser(description='Sync PHRASES to the Firestore phrases collection')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+    args = parser.parse_args()
+
+    from google.cloud import firestore
+    from google.oauth2 import service_account
+
     credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_PATH)
     db = firestore.Client(project=PROJECT_ID, credentials=credentials)
-
-    # Delete all existing phrases
-    print("Deleting all existing phrases...")
     phrases_ref = db.collection('phrases')
-    for phrase in phrases_ref.stream():
-        phrase.reference.delete()
-    print("All existing phrases deleted.")
 
-    batch = db.batch()
-    for i, phrase in enumerate(PHRASES):
-        words = phrase.split()
-        if len(words) != 2:
+    records = []
+    for phrase in PHRASES:
+        record = phrase_record(phrase)
+        if not record:
             print(f"Skipping invalid phrase: {phrase}")
             continue
-        # Pick one word, deterministically
-        random.seed(phrase)
-        word = words[random.randint(0, 1)]
-        doc_ref = db.collection('phrases').document()
-        batch.set(doc_ref, {
-            'text': phrase,
-            'word': word,
-            'used': False
-        })
-        # Commit every 25 to avoid batch size limits
-        if (i + 1) % 25 == 0:
-            batch.commit()
-            batch = db.batch()
-    # Commit any remaining
-    batch.commit()
-    print(f"Uploaded {len(PHRASES)} phrases to Firestore.")
+        records.append(record)
+
+    # Only IDs are needed for the diff; existing docs keep their 'used' state
+    stored_ids = {ref.id for ref in phrases_ref.list_documents()}
+    inserts, deletes = diff_phrases(records, stored_ids)
+    print(f"{len(records)} phrases in list, {len(stored_ids)} stored: "
+          f"{len(inserts)} to insert, {len(deletes)} to delete, {len(records) - len(inserts)} unchanged.")
+
+    if args.dry_run:
+        for record in inserts.values():
+            print(f"  + {record['text']} ({record['word']})")
+        for pid in deletes:
+            print(f"  - {pid}")
+        return
+
+    writes = [(pid, record) for pid, record in inserts.items()] + [(pid, None) for pid in deletes]
+    for start in range(0, len(writes), BATCH_SIZE):
+        batch = db.batch()
+        for pid, record in writes[start:start + BATCH_SIZE]:
+            if record is None:
+                batch.delete(phrases_ref.document(pid))
+            else:
+                batch.set(phrases_ref.document(pid), {
+                    'text': record['text'],
+                    'word': record['word'],
+                    'used': False,
+                    # Random key that get_random_phrase seeks into
+                    'rand': random.random()
+                })
+        batch.commit()
+        print(f"Committed {min(start + BATCH_SIZE, len(writes))}/{len(writes)} writes.")
+    print(f"Synced phrases: {len(inserts)} inserted, {len(deletes)} deleted.")
 
 if __name__ == '__main__':
     main()
@@ -1,23 +1,33 @@
 from flask import Flask, request, jsonify, render_template, send_from_directory
 import db_funcs
-import uuid
 from functools import wraps
+from game_cache import GameBodyCache
 import os
+import secrets
+from session_tokens import SessionTokens
 import datetime
 
 app = Flask(__name__)
 
-# In-memory session store
-sessions = {}
+# Signed session tokens: any worker holding SECRET_KEY can verify them
+app.secret_key = os.environ.get('SECRET_KEY')
+if not app.secret_key:
+    # Tokens only verify in this process; set SECRET_KEY when running more than one
+    app.logger.warning('SECRET_KEY not set, using a random per-process key')
+    app.secret_key = secrets.token_hex(32)
+tokens = SessionTokens(app.secret_key, salt='venns-session')
+
+# Latest /get_game body per game, keyed by version
+game_bodies = GameBodyCache()
 
 def require_session(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        session_token = request.headers.get('X-Session-Token')
-        if not session_token or session_token not in sessions:
+        session = tokens.verify(request.headers.get('X-Session-Token') or '')
+        if not session:
             return jsonify({'error': 'Invalid or missing session token'}), 401
-        request.player_id = sessions[session_token]['player_id']
-        request.game_id = sessions[session_token]['game_id']
+        request.player_id = session['player_id']
+        request.game_id = session['game_id']
         return f(*args, **kwargs)
     return decorated
 
@@ -46,8 +56,7 @@ def add_player():
     player_id = db_funcs.add_player(game_id, player_name)
     
     # Create session token
-    session_token = str(uuid.uuid4())
-    sessions[session_token] = {'player_id': player_id, 'game_id': game_id}
+    session_token = tokens.issue(player_id, game_id)
     
     return jsonify({'player_id': player_id, 'session_token': session_token})
 
@@ -82,7 +91,7 @@ def start_game():
         'state': 'active',
         'round': 1,
         'word_pairs': word_pairs,
-        'submissions': {},
+        **db_funcs.round_reset_fields(),
         'round_status': 'submitting' # Possible values: submitting, voting, finished
     })
     
@@ -90,10 +99,27 @@ def start_game():
 
 @app.route('/get_game/<game_id>', methods=['GET'])
 def get_game(game_id):
-    game = db_funcs.get_game(game_id)
-    if not game:
+    # Check the version first so an unchanged game costs one tiny read and no body
+    version = db_funcs.get_game_version(game_id)
+    if version is None:
         return jsonify({'error': 'Game not found'}), 404
-    return jsonify(game)
+    if request.if_none_match.contains(str(version)):
+        response = app.response_class(status=304)
+    else:
+        body = game_bodies.get(game_id, version)
+        if body is None:
+            game = db_funcs.get_game(game_id)
+            if not game:
+                return jsonify({'error': 'Game not found'}), 404
+            # The game may have moved on since the version check
+            version = game.get('version', 0)
+            body = app.json.dumps(game)
+            game_bodies.put(game_id, version, body)
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(str(version))
+    # Let browsers keep the body but always revalidate it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/submit_phrase', methods=['POST'])
 @require_session
@@ -105,33 +131,20 @@ def submit_phrase():
     if not all([target_player_id, phrase]):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    game = db_funcs.get_game(request.game_id)
-    if not game or game.get('state') != 'active' or game.get('round_status') != 'submitting':
-        return jsonify({'error': 'Cannot submit phrase at this time'}), 400
-    
     # Prevent submitting to yourself
     if target_player_id == request.player_id:
         return jsonify({'error': 'Cannot submit phrase for your own word pair'}), 400
     
-    # Check if the current player has already submitted a phrase for this target
-    submissions = game.get('submissions', {})
-    player_submissions = submissions.get(request.player_id, {})
-    
-    if target_player_id in player_submissions:
-        return jsonify({'error': 'You have already submitted a phrase for this player'}), 400
-    
-    # Add the submission
-    success = db_funcs.add_submission(request.game_id, request.player_id, target_player_id, phrase)
-    
-    if not success:
-        return jsonify({'error': 'Failed to submit phrase'}), 500
+    # Add the submission; the switch to voting happens in the same commit
+    # once every player has at least 3 submissions
+    round_status, error = db_funcs.add_submission(request.game_id, request.player_id, target_player_id, phrase)
     
-    # Check if all phrases have been submitted (at least 3 for each player)
-    all_submitted = db_funcs.check_all_submissions_complete(request.game_id)
-    if all_submitted:
-        db_funcs.update_game_state(request.game_id, {'round_status': 'voting'})
+    if error == 'not_submitting':
+        return jsonify({'error': 'Cannot submit phrase at this time'}), 400
+    if error == 'unknown_target':
+        return jsonify({'error': 'Unknown target player'}), 400
     
-    return jsonify({'ok': True})
+    return jsonify({'ok': True, 'round_status': round_status})
 
 @app.route('/get_submissions_for_player', methods=['GET'])
 @require_session
@@ -140,10 +153,12 @@ def get_submissions_for_player():
     if not game:
         return jsonify({'error': 'Game not found'}), 404
     
-    # Get all phrases submitted for the current player's word pair
-    submissions = db_funcs.get_submissions_for_player(request.game_id, request.player_id)
+    # Get all phrases submitted for the current player's word pair this round
+    round_num = game.get('round', 1)
+    submissions = db_funcs.get_submissions_for_player(request.game_id, request.player_id, round_num)
+    voted_submission_id = db_funcs.get_vote(request.game_id, request.player_id, round_num)
     
-    return jsonify({'submissions': submissions})
+    return jsonify({'submissions': submissions, 'voted_submission_id': voted_submission_id})
 
 @app.route('/vote_for_phrase', methods=['POST'])
 @require_session
@@ -154,24 +169,16 @@ def vote_for_phrase():
     if not submission_id:
         return jsonify({'error': 'Missing submission ID'}), 400
     
-    game = db_funcs.get_game(request.game_id)
-    if not game or game.get('state') != 'active' or game.get('round_status') != 'voting':
-        return jsonify({'error': 'Cannot vote at this time'}), 400
-    
-    # Submit the vote
-    success = db_funcs.add_vote(request.game_id, request.player_id, submission_id)
-    
-    if not success:
-        return jsonify({'error': 'Failed to submit vote'}), 500
+    # Submit the vote; the last vote also scores the round and marks it
+    # finished, all in the same commit
+    round_status, error = db_funcs.add_vote(request.game_id, request.player_id, submission_id)
     
-    # Check if all players have voted
-    all_voted = db_funcs.check_all_votes_complete(request.game_id)
-    if all_voted:
-        # Update scores based on votes
-        db_funcs.update_scores_based_on_votes(request.game_id)
-        db_funcs.update_game_state(request.game_id, {'round_status': 'finished'})
+    if error == 'unknown_submission':
+        return jsonify({'error': 'Unknown submission'}), 400
+    if error:
+        return jsonify({'error': 'Cannot vote at this time'}), 400
     
-    return jsonify({'ok': True})
+    return jsonify({'ok': True, 'round_status': round_status})
 
 @app.route('/start_next_round', methods=['POST'])
 @require_session
@@ -193,7 +200,7 @@ def start_next_round():
     db_funcs.update_game_state(request.game_id, {
         'round': current_round + 1,
         'word_pairs': word_pairs,
-        'submissions': {},
+        **db_funcs.round_reset_fields(),
         'round_status': 'submitting'
     })
     
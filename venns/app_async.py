@@ -0,0 +1,209 @@
+"""asyncio variant of app.py, served by an ASGI server:
+
+    hypercorn app_async:app --bind 0.0.0.0:8080
+
+Routes and responses match app.py. Each request is a coroutine instead of a
+worker thread, so a process can hold thousands of polls waiting on Firestore.
+"""
+from quart import Quart, request, jsonify, render_template, send_from_directory
+import asyncio
+import db_funcs_async as db_funcs
+from functools import wraps
+from game_cache import GameBodyCache
+import os
+import secrets
+from session_tokens import SessionTokens
+
+app = Quart(__name__)
+
+# Signed session tokens: any worker holding SECRET_KEY can verify them
+app.secret_key = os.environ.get('SECRET_KEY')
+if not app.secret_key:
+    # Tokens only verify in this process; set SECRET_KEY when running more than one
+    app.logger.warning('SECRET_KEY not set, using a random per-process key')
+    app.secret_key = secrets.token_hex(32)
+tokens = SessionTokens(app.secret_key, salt='venns-session')
+
+# Latest /get_game body per game, keyed by version
+game_bodies = GameBodyCache()
+
+def require_session(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        session = tokens.verify(request.headers.get('X-Session-Token') or '')
+        if not session:
+            return jsonify({'error': 'Invalid or missing session token'}), 401
+        request.player_id = session['player_id']
+        request.game_id = session['game_id']
+        return await f(*args, **kwargs)
+    return decorated
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/static/<path:filename>')
+async def static_files(filename):
+    return await send_from_directory(os.path.join(app.root_path, 'static'), filename)
+
+@app.route('/create_game', methods=['POST'])
+async def create_game():
+    game_id = await db_funcs.create_game()
+    return jsonify({'game_id': game_id})
+
+@app.route('/add_player', methods=['POST'])
+async def add_player():
+    data = await request.get_json()
+    game_id = data.get('game_id')
+    player_name = data.get('player_name')
+
+    if not all([game_id, player_name]):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    player_id = await db_funcs.add_player(game_id, player_name)
+
+    # Create session token
+    session_token = tokens.issue(player_id, game_id)
+
+    return jsonify({'player_id': player_id, 'session_token': session_token})
+
+@app.route('/list_games', methods=['GET'])
+async def list_games():
+    games = await db_funcs.list_waiting_games()
+    # Add a label for each game
+    for g in games:
+        n_players = len(g['players'])
+        g['label'] = f"Game {g['game_id'][:8]} ({n_players} players)"
+    return jsonify({'games': games})
+
+@app.route('/start_game', methods=['POST'])
+async def start_game():
+    data = await request.get_json()
+    game_id = data.get('game_id')
+    # Refresh the word index while the game is read
+    game, _ = await asyncio.gather(db_funcs.get_game(game_id), db_funcs.sync_word_index())
+
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
+
+    players = game.get('players', [])
+
+    if game.get('state') != 'waiting' or len(players) < 3:
+        return jsonify({'error': 'Game cannot be started (need at least 3 players and waiting state)'}), 400
+
+    # Deal word pairs for the first round and activate the game
+    await db_funcs.start_round(game_id, players, {
+        'state': 'active',
+        'round': 1,
+        'round_status': 'submitting' # Possible values: submitting, voting, finished
+    })
+
+    return jsonify({'ok': True})
+
+@app.route('/get_game/<game_id>', methods=['GET'])
+async def get_game(game_id):
+    # Check the version first so an unchanged game costs one tiny read and no body
+    version = await db_funcs.get_game_version(game_id)
+    if version is None:
+        return jsonify({'error': 'Game not found'}), 404
+    if request.if_none_match.contains(str(version)):
+        response = app.response_class('', status=304)
+    else:
+        body = game_bodies.get(game_id, version)
+        if body is None:
+            game = await db_funcs.get_game(game_id)
+            if not game:
+                return jsonify({'error': 'Game not found'}), 404
+            # The game may have moved on since the version check
+            version = game.get('version', 0)
+            body = app.json.dumps(game)
+            game_bodies.put(game_id, version, body)
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(str(version))
+    # Let browsers keep the body but always revalidate it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/submit_phrase', methods=['POST'])
+@require_session
+async def submit_phrase():
+    data = await request.get_json()
+    target_player_id = data.get('target_player_id')
+    phrase = data.get('phrase')
+
+    if not all([target_player_id, phrase]):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    # Prevent submitting to yourself
+    if target_player_id == request.player_id:
+        return jsonify({'error': 'Cannot submit phrase for your own word pair'}), 400
+
+    # Add the submission; the switch to voting happens in the same commit
+    # once every player has at least 3 submissions
+    round_status, error = await db_funcs.add_submission(request.game_id, request.player_id, target_player_id, phrase)
+
+    if error == 'not_submitting':
+        return jsonify({'error': 'Cannot submit phrase at this time'}), 400
+    if error == 'unknown_target':
+        return jsonify({'error': 'Unknown target player'}), 400
+
+    return jsonify({'ok': True, 'round_status': round_status})
+
+@app.route('/get_submissions_for_player', methods=['GET'])
+@require_session
+async def get_submissions_for_player():
+    game = await db_funcs.get_game(request.game_id)
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
+
+    # Get all phrases submitted for the current player's word pair this round,
+    # and the player's own vote, at the same time
+    round_num = game.get('round', 1)
+    submissions, voted_submission_id = await asyncio.gather(
+        db_funcs.get_submissions_for_player(request.game_id, request.player_id, round_num),
+        db_funcs.get_vote(request.game_id, request.player_id, round_num)
+    )
+
+    return jsonify({'submissions': submissions, 'voted_submission_id': voted_submission_id})
+
+@app.route('/vote_for_phrase', methods=['POST'])
+@require_session
+async def vote_for_phrase():
+    data = await request.get_json()
+    submission_id = data.get('submission_id')
+
+    if not submission_id:
+        return jsonify({'error': 'Missing submission ID'}), 400
+
+    # Submit the vote; the last vote also scores the round and marks it
+    # finished, all in the same commit
+    round_status, error = await db_funcs.add_vote(request.game_id, request.player_id, submission_id)
+
+    if error == 'unknown_submission':
+        return jsonify({'error': 'Unknown submission'}), 400
+    if error:
+        return jsonify({'error': 'Cannot vote at this time'}), 400
+
+    return jsonify({'ok': True, 'round_status': round_status})
+
+@app.route('/start_next_round', methods=['POST'])
+@require_session
+async def start_next_round():
+    # Refresh the word index while the game is read
+    game, _ = await asyncio.gather(db_funcs.get_game(request.game_id), db_funcs.sync_word_index())
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
+
+    if game.get('state') != 'active' or game.get('round_status') != 'finished':
+        return jsonify({'error': 'Cannot start next round at this time'}), 400
+
+    # Deal new word pairs and move to the next round
+    await db_funcs.start_round(request.game_id, game.get('players', []), {
+        'round': game.get('round', 1) + 1,
+        'round_status': 'submitting'
+    })
+
+    return jsonify({'ok': True})
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=8080)
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""Expire abandoned lobbies and archive idle games.
+
+Run it on a schedule (cron, Cloud Scheduler) to keep venns_games and the
+waiting-games query small. Safe to rerun: only games past their TTL are touched.
+"""
+import argparse
+import db_funcs
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean up old games for Venns with Benefits')
+    parser.parse_args()
+    
+    print("Compacting games...")
+    removed = db_funcs.compact_games()
+    print(f"{removed} games expired or archived.")
+
+if __name__ == '__main__':
+    main()
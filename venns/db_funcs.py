@@ -1,11 +1,17 @@
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 import random
 import datetime
 import json
+import logging
 import os
+import threading
+import time
+from google.api_core import exceptions as api_exceptions
+from word_index import WordIndex
 
 # Initialize Firebase
 try:
@@ -20,23 +26,32 @@ db = firestore.client()
 # Constants
 COLLECTION_GAMES = 'venns_games'
 COLLECTION_WORDS = 'venns_words'
+# Per-game subcollections, one document per submission / vote
+SUBCOLLECTION_SUBMISSIONS = 'submissions'
+SUBCOLLECTION_VOTES = 'votes'
 THRESHOLD_DAYS = 7  # Don't reuse words for 7 days
 
-def create_game():
-    """Create a new game with a unique ID."""
-    game_id = str(uuid.uuid4())
-    
-    # Create initial game state
-    game_data = {
+def touch_fields():
+    """Fields every game write sets: the /get_game version and the idle clock used by compaction."""
+    return {'version': firestore.Increment(1), 'updated_at': firestore.SERVER_TIMESTAMP}
+
+def new_game(game_id):
+    """Initial document of a new game."""
+    return {
         'game_id': game_id,
         'state': 'waiting',  # waiting, active, finished
         'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP,
         'players': [],
         'player_names': {},
         'scores': {},
+        'version': 1,  # bumped by every write, used as the /get_game ETag
     }
-    
-    db.collection(COLLECTION_GAMES).document(game_id).set(game_data)
+
+def create_game():
+    """Create a new game with a unique ID."""
+    game_id = str(uuid.uuid4())
+    db.collection(COLLECTION_GAMES).document(game_id).set(new_game(game_id))
     return game_id
 
 def add_player(game_id, player_name):
@@ -53,7 +68,8 @@ def add_player(game_id, player_name):
     game_ref.update({
         'players': firestore.ArrayUnion([player_id]),
         f'player_names.{player_id}': player_name,
-        f'scores.{player_id}': 0
+        f'scores.{player_id}': 0,
+        **touch_fields()
     })
     
     return player_id
@@ -73,11 +89,19 @@ def get_game(game_id):
     return game_data
 
 def update_game_state(game_id, updates):
-    """Update game state with the provided updates."""
+    """Update game state with the provided updates and bump its version."""
     game_ref = db.collection(COLLECTION_GAMES).document(game_id)
-    game_ref.update(updates)
+    game_ref.update({**updates, **touch_fields()})
     return True
 
+def get_game_version(game_id):
+    """Return the game's version without reading the rest of it, or None if it doesn't exist."""
+    game_doc = db.collection(COLLECTION_GAMES).document(game_id).get(field_paths=['version'])
+    if not game_doc.exists:
+        return None
+    # Games created before versioning count as version 0
+    return (game_doc.to_dict() or {}).get('version', 0)
+
 def list_waiting_games():
     """List games that are in the 'waiting' state."""
     games = []
@@ -90,208 +114,487 @@ def list_waiting_games():
     
     return games
 
+# Used when the word collection is too small to draw from
+FALLBACK_WORDS = ["Toast", "Grandma", "Divorce", "Snakes", "Coffee", "Unicorn",
+                  "Pizza", "Beach", "Moon", "Computer", "Zombie", "Chocolate"]
+# Seconds between picking up other instances' word usage, and between full reloads
+WORD_SYNC_INTERVAL = 30
+WORD_RELOAD_INTERVAL = 60 * 60
+
+# Freshness index of the whole word corpus, shared by every draw in this process
+word_index = WordIndex(THRESHOLD_DAYS)
+_word_sync = {'loaded': 0.0, 'synced': 0.0, 'since': None}
+_word_sync_lock = threading.Lock()
+
+def word_sync_query(words_ref, sync, now):
+    """Plan the next word index refresh from the sync state and a monotonic now.
+
+    Returns (query, full) where full means the results replace the whole
+    index, or (None, False) if the index is current.
+    """
+    if not sync['loaded'] or now - sync['loaded'] > WORD_RELOAD_INTERVAL:
+        return words_ref.select(['text', 'last_used']), True
+    if now - sync['synced'] > WORD_SYNC_INTERVAL:
+        # Overlap the window a little to allow for clock skew between instances
+        query = words_ref.where('last_used', '>', sync['since'] - datetime.timedelta(seconds=5))
+        return query.select(['text', 'last_used']), False
+    return None, False
+
+def apply_word_sync(sync, words, full, now, since):
+    """Apply the word documents returned by a word_sync_query started at since."""
+    if full:
+        word_index.load(((w.get('text'), w.get('last_used')) for w in words), since)
+        sync.update(loaded=now, synced=now, since=since)
+    else:
+        for w in words:
+            word_index.mark_used([w['text']], w['last_used'])
+        sync.update(synced=now, since=since)
+
+def _sync_word_index():
+    """Load the corpus once, then apply only words other instances have used since."""
+    with _word_sync_lock:
+        now = time.monotonic()
+        query, full = word_sync_query(db.collection(COLLECTION_WORDS), _word_sync, now)
+        if query is not None:
+            since = datetime.datetime.now()
+            apply_word_sync(_word_sync, (doc.to_dict() for doc in query.stream()), full, now, since)
+
+def draw_from_index(count):
+    """Draw count distinct words from the word index as it stands, padded with fallbacks."""
+    words = word_index.draw(count, datetime.datetime.now())
+
+    # If not enough words, use fallback words
+    if len(words) < count:
+        words = list(dict.fromkeys(words + random.sample(FALLBACK_WORDS, len(FALLBACK_WORDS))))
+    if len(words) < count:
+        # Not enough distinct words at all; repeats are unavoidable
+        return words + random.choices(words, k=count - len(words))
+
+    return words[:count]
+
+def draw_words(count):
+    """Draw count distinct words, preferring ones not used within THRESHOLD_DAYS.
+
+    Served from the in-memory word index: fresh words are sampled uniformly
+    from the whole corpus, then the least recently used ones fill any gap.
+    """
+    _sync_word_index()
+    return draw_from_index(count)
+
 def get_random_word_pair():
     """Get a random pair of words that haven't been used recently."""
-    # Get all words
-    words_ref = db.collection(COLLECTION_WORDS)
-    words = []
-    
-    # Query for words that haven't been used recently
-    cutoff_date = datetime.datetime.now() - datetime.timedelta(days=THRESHOLD_DAYS)
-    query = words_ref.where('last_used', '<', cutoff_date).limit(100)
-    
-    for doc in query.stream():
-        word_data = doc.to_dict()
-        words.append(word_data['text'])
-    
-    # If not enough words, get any words
-    if len(words) < 2:
-        query = words_ref.limit(100)
-        words = []
-        for doc in query.stream():
-            word_data = doc.to_dict()
-            words.append(word_data['text'])
-    
-    # Pick two random words
-    if len(words) < 2:
-        # If still not enough words, use fallback words
-        fallback_words = ["Toast", "Grandma", "Divorce", "Snakes", "Coffee", "Unicorn", 
-                         "Pizza", "Beach", "Moon", "Computer", "Zombie", "Chocolate"]
-        return random.sample(fallback_words, 2)
-    
-    return random.sample(words, 2)
+    return draw_words(2)
 
-def update_word_usage(words):
-    """Update the last used timestamp for a list of words."""
+# Firestore allows up to 500 writes per batch
+BATCH_SIZE = 500
+
+def word_id(word):
+    """Document ID of a word in the words collection."""
+    return word.lower().replace(' ', '-')
+
+def word_usage_batches(words):
+    """Mark words as used now in the index and return their usage writes.
+
+    Returns lists of up to BATCH_SIZE (word document ID, fields) pairs, to be
+    merge-upserted so missing words are created by the same write.
+    """
     current_time = datetime.datetime.now()
-    
-    for word in words:
-        word_id = word.lower().replace(' ', '-')
-        word_ref = db.collection(COLLECTION_WORDS).document(word_id)
-        
-        # Check if word exists, if not create it
-        word_doc = word_ref.get()
-        if not word_doc.exists:
-            word_ref.set({
-                'text': word,
-                'created_at': current_time,
-                'last_used': current_time
-            })
-        else:
-            word_ref.update({
-                'last_used': current_time
-            })
+    words = list(dict.fromkeys(words))
+    word_index.mark_used(words, current_time)
+    writes = [(word_id(word), {'text': word, 'last_used': current_time}) for word in words]
+    return [writes[start:start + BATCH_SIZE] for start in range(0, len(writes), BATCH_SIZE)]
+
+def update_word_usage(words):
+    """Update the last used timestamp for a list of words, one batch commit per 500 words."""
+    for writes in word_usage_batches(words):
+        batch = db.batch()
+        for doc_id, fields in writes:
+            batch.set(db.collection(COLLECTION_WORDS).document(doc_id), fields, merge=True)
+        batch.commit()
 
 def get_word_pairs_for_players(game_id, players):
     """Assign word pairs to each player."""
-    word_pairs = {}
-    used_words = []
-    
-    for player_id in players:
-        word_pair = get_random_word_pair()
-        while any(word in used_words for word in word_pair):
-            word_pair = get_random_word_pair()
-        
-        word_pairs[player_id] = word_pair
-        used_words.extend(word_pair)
+    # One draw of 2N distinct words, split into pairs
+    words = draw_words(2 * len(players))
+    word_pairs = {player_id: words[2 * i:2 * i + 2] for i, player_id in enumerate(players)}
     
     # Update usage timestamp for all words
     update_word_usage([word for pair in word_pairs.values() for word in pair])
     
     return word_pairs
 
+# Submissions each player's word pair needs before voting starts
+SUBMISSIONS_NEEDED = 3
+
+def _submissions_ref(game_id):
+    return db.collection(COLLECTION_GAMES).document(game_id).collection(SUBCOLLECTION_SUBMISSIONS)
+
+def _votes_ref(game_id):
+    return db.collection(COLLECTION_GAMES).document(game_id).collection(SUBCOLLECTION_VOTES)
+
+def vote_id(round_num, player_id):
+    """Document ID of a player's vote in a round."""
+    return f'{round_num}_{player_id}'
+
+def round_reset_fields():
+    """Game fields that start each round empty, including the completion counters."""
+    return {
+        'submission_counts': {},    # to_player -> submissions received this round
+        'submissions_complete': 0,  # players with at least SUBMISSIONS_NEEDED
+        'votes_cast': 0,
+        'round_points': {},         # submitter -> votes received this round
+        # Submissions and votes live in subcollections; drop maps left by older games
+        'submissions': firestore.DELETE_FIELD,
+        'votes': firestore.DELETE_FIELD
+    }
+
+def plan_submission(game, player_id, target_player_id, phrase):
+    """Decide a phrase submission against the game document.
+
+    Returns (round_status, updates, submission, error): the game fields to
+    update (without touch_fields), the submission document to create, and
+    error None, 'not_submitting' or 'unknown_target'. Once every player has
+    SUBMISSIONS_NEEDED submissions the updates switch the round to voting.
+    """
+    if not game or game.get('state') != 'active' or game.get('round_status') != 'submitting':
+        return None, None, None, 'not_submitting'
+    # Only real players' word pairs count towards moving on to voting
+    if target_player_id not in game.get('players', []):
+        return None, None, None, 'unknown_target'
+    
+    count = game.get('submission_counts', {}).get(target_player_id, 0) + 1
+    complete = game.get('submissions_complete', 0) + (1 if count == SUBMISSIONS_NEEDED else 0)
+    updates = {
+        f'submission_counts.{target_player_id}': count,
+        'submissions_complete': complete
+    }
+    round_status = 'submitting'
+    if complete >= len(game.get('players', [])):
+        round_status = updates['round_status'] = 'voting'
+    submission = {
+        'round': game.get('round', 1),
+        'from_player': player_id,
+        'to_player': target_player_id,
+        'phrase': phrase,
+        'timestamp': firestore.SERVER_TIMESTAMP
+    }
+    return round_status, updates, submission, None
+
 def add_submission(game_id, player_id, target_player_id, phrase):
-    """Add a phrase submission from one player for another player's word pair."""
-    submission_id = str(uuid.uuid4())
-    
+    """Add a phrase submission from one player for another player's word pair.
+
+    The submission document, the counters and (once every player has enough
+    submissions) the switch to voting are written in one transaction; see
+    plan_submission. Players may send several phrases to the same target.
+    Returns (round_status, error) where error is None, 'not_submitting' or
+    'unknown_target'.
+    """
     game_ref = db.collection(COLLECTION_GAMES).document(game_id)
     
-    # Update submissions in game state
-    game_ref.update({
-        f'submissions.{submission_id}': {
-            'from_player': player_id,
-            'to_player': target_player_id,
-            'phrase': phrase,
-            'timestamp': firestore.SERVER_TIMESTAMP,
-            'voted': False
-        }
-    })
-    
-    return True
+    @firestore.transactional
+    def submit(transaction):
+        snapshot = game_ref.get(transaction=transaction)
+        round_status, updates, submission, error = plan_submission(
+            snapshot.to_dict() if snapshot.exists else None, player_id, target_player_id, phrase)
+        if error:
+            return None, error
+        transaction.create(_submissions_ref(game_id).document(str(uuid.uuid4())), submission)
+        transaction.update(game_ref, {**updates, **touch_fields()})
+        return round_status, None
+    
+    return submit(db.transaction())
 
-def check_all_submissions_complete(game_id):
-    """Check if all players have received at least 3 submissions for their word pair."""
-    game = get_game(game_id)
-    if not game:
-        return False
-    
-    players = game.get('players', [])
-    submissions = game.get('submissions', {})
+def get_submissions_for_player(game_id, player_id, round_num):
+    """Get all phrases submitted for a specific player's word pair in a round."""
+    query = (_submissions_ref(game_id)
+             .where('to_player', '==', player_id)
+             .where('round', '==', round_num))
     
-    # Count submissions for each player
-    submission_counts = {player_id: 0 for player_id in players}
-    
-    for sub_id, sub_data in submissions.items():
-        target = sub_data.get('to_player')
-        if target in submission_counts:
-            submission_counts[target] += 1
-    
-    # Check if all players have at least 3 submissions
-    return all(count >= 3 for count in submission_counts.values())
-
-def get_submissions_for_player(game_id, player_id):
-    """Get all phrases submitted for a specific player's word pair."""
-    game = get_game(game_id)
-    if not game:
-        return []
-    
-    submissions = game.get('submissions', {})
-    player_submissions = []
-    
-    for sub_id, sub_data in submissions.items():
-        if sub_data.get('to_player') == player_id:
-            player_submissions.append({
-                'id': sub_id,
-                'phrase': sub_data.get('phrase')
-            })
+    return [{'id': doc.id, 'phrase': doc.get('phrase')} for doc in query.stream()]
+
+def get_vote(game_id, player_id, round_num):
+    """Return the submission ID the player voted for in a round, or None."""
+    vote_doc = _votes_ref(game_id).document(vote_id(round_num, player_id)).get()
+    return vote_doc.get('submission_id') if vote_doc.exists else None
+
+def voting_open(game):
+    """Whether the game is taking votes."""
+    return bool(game) and game.get('state') == 'active' and game.get('round_status') == 'voting'
+
+def plan_vote(game, player_id, submission_id, submission, previous):
+    """Decide a vote against the game document, which must be voting_open.
+
+    submission is the voted-for submission document and previous the
+    player's earlier vote this round, each None if it doesn't exist.
+    Returns (round_status, updates, vote, error): the game fields to update
+    (without touch_fields), the vote document to set, and error None or
+    'unknown_submission'. On the final vote the updates also add the
+    round's points to the scores and finish the round.
+    """
+    round_num = game.get('round', 1)
+    if not submission or submission.get('round') != round_num:
+        return None, None, None, 'unknown_submission'
+    
+    # Each vote is worth 1 point to the submitter of the phrase
+    round_points = dict(game.get('round_points', {}))
+    submitter_id = submission.get('from_player')
+    votes_cast = game.get('votes_cast', 0)
+    if previous:
+        # Changing a vote moves its point instead of counting a new vote
+        old_submitter = previous.get('from_player')
+        if old_submitter:
+            round_points[old_submitter] = round_points.get(old_submitter, 0) - 1
+    else:
+        votes_cast += 1
+    if submitter_id:
+        round_points[submitter_id] = round_points.get(submitter_id, 0) + 1
+    updates = {
+        'votes_cast': votes_cast,
+        'round_points': round_points
+    }
     
-    return player_submissions
+    round_status = 'voting'
+    if votes_cast >= len(game.get('players', [])):
+        # Last vote: apply the round's points to the scores in this same commit
+        scores = game.get('scores', {})
+        for pid, points in round_points.items():
+            if points:
+                updates[f'scores.{pid}'] = scores.get(pid, 0) + points
+        round_status = updates['round_status'] = 'finished'
+    vote = {
+        'round': round_num,
+        'voter': player_id,
+        'submission_id': submission_id,
+        'from_player': submitter_id,
+        'timestamp': firestore.SERVER_TIMESTAMP
+    }
+    return round_status, updates, vote, None
 
 def add_vote(game_id, player_id, submission_id):
-    """Add a vote for a phrase."""
+    """Add a vote for a phrase, closing the round if it was the last one.
+
+    The vote document, the votes_cast and round_points counters and, on the
+    final vote, the score tally and the switch to 'finished' are written in
+    one transaction, so a round is scored exactly once; see plan_vote.
+    Returns (round_status, error) where error is None, 'not_voting' or
+    'unknown_submission'.
+    """
     game_ref = db.collection(COLLECTION_GAMES).document(game_id)
     
-    # Update vote status in game state
-    game_ref.update({
-        f'votes.{player_id}': submission_id,
-        f'submissions.{submission_id}.voted': True
-    })
-    
-    return True
+    @firestore.transactional
+    def vote(transaction):
+        snapshot = game_ref.get(transaction=transaction)
+        game = snapshot.to_dict() if snapshot.exists else None
+        if not voting_open(game):
+            return None, 'not_voting'
+        vote_ref = _votes_ref(game_id).document(vote_id(game.get('round', 1), player_id))
+        submission = _submissions_ref(game_id).document(submission_id).get(transaction=transaction)
+        previous = vote_ref.get(transaction=transaction)
+        round_status, updates, vote_doc, error = plan_vote(
+            game, player_id, submission_id,
+            submission.to_dict() if submission.exists else None,
+            previous.to_dict() if previous.exists else None)
+        if error:
+            return None, error
+        transaction.update(game_ref, {**updates, **touch_fields()})
+        transaction.set(vote_ref, vote_doc)
+        return round_status, None
+    
+    return vote(db.transaction())
 
-def check_all_votes_complete(game_id):
-    """Check if all players have voted."""
-    game = get_game(game_id)
-    if not game:
-        return False
-    
-    players = game.get('players', [])
-    votes = game.get('votes', {})
-    
-    # Check if all players have voted
-    return all(player_id in votes for player_id in players)
-
-def update_scores_based_on_votes(game_id):
-    """Update player scores based on votes."""
-    game = get_game(game_id)
-    if not game:
-        return False
-    
-    votes = game.get('votes', {})
-    submissions = game.get('submissions', {})
-    scores = game.get('scores', {})
-    
-    # Count votes for each player's submissions
-    for voter_id, submission_id in votes.items():
-        if submission_id in submissions:
-            submitter_id = submissions[submission_id].get('from_player')
-            if submitter_id:
-                # Add 1 point to the submitter
-                scores[submitter_id] = scores.get(submitter_id, 0) + 1
-    
-    # Update scores in database
-    update_game_state(game_id, {'scores': scores})
-    
-    return True
+# Compaction: lobbies nobody started are deleted after LOBBY_EXPIRY, other games
+# are archived and deleted once nothing has happened in them for GAME_TTL
+COLLECTION_ARCHIVE = 'venns_games_archive'
+LOBBY_EXPIRY = datetime.timedelta(hours=2)
+GAME_TTL = datetime.timedelta(days=1)
 
-def add_words_from_file(filename):
-    """Add words from a JSON file to the database."""
-    if not os.path.exists(filename):
-        return 0
-    
-    with open(filename, 'r') as f:
-        word_list = json.load(f)
-    
+def _archive_doc(game, now):
+    """Compact record of a game: when it ran, rounds played and final scores by name."""
+    names = game.get('player_names', {})
+    return {
+        'created_at': game.get('created_at'),
+        'archived_at': now,
+        'rounds': game.get('round', 0),
+        'scores': {names.get(pid, pid): score for pid, score in game.get('scores', {}).items()}
+    }
+
+def _delete_game(game_ref, archive=None):
+    """Delete a game with its submissions and votes, storing archive first if given."""
+    writes = [(ref, None) for ref in game_ref.collection(SUBCOLLECTION_SUBMISSIONS).list_documents()]
+    writes += [(ref, None) for ref in game_ref.collection(SUBCOLLECTION_VOTES).list_documents()]
+    if archive is not None:
+        writes.append((db.collection(COLLECTION_ARCHIVE).document(game_ref.id), archive))
+    writes.append((game_ref, None))
+    
+    # Batches are committed in order, so the game document always goes last and
+    # a run that stops part way is finished by the next one
+    for start in range(0, len(writes), BATCH_SIZE):
+        batch = db.batch()
+        for ref, data in writes[start:start + BATCH_SIZE]:
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+        batch.commit()
+
+def compact_games(now=None):
+    """Delete expired lobbies and archive idle games. Returns the number of games removed."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    # Every candidate was created before the shorter TTL
+    query = (db.collection(COLLECTION_GAMES)
+             .where('created_at', '<', now - min(LOBBY_EXPIRY, GAME_TTL))
+             .order_by('created_at')
+             .select(['state', 'created_at', 'updated_at', 'round', 'scores', 'player_names'])
+             .limit(BATCH_SIZE))
+    removed = 0
+    last = None
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        for game_doc in page:
+            game = game_doc.to_dict()
+            if game.get('state') == 'waiting':
+                if game['created_at'] < now - LOBBY_EXPIRY:
+                    _delete_game(game_doc.reference)
+                    removed += 1
+            elif (game.get('updated_at') or game['created_at']) < now - GAME_TTL:
+                _delete_game(game_doc.reference, _archive_doc(game, now))
+                removed += 1
+        if len(page) < BATCH_SIZE:
+            return removed
+        last = page[-1]
+
+# Word import: batch commits in flight at once, attempts per batch, and file read size
+IMPORT_WORKERS = 8
+IMPORT_ATTEMPTS = 3
+IMPORT_CHUNK_SIZE = 64 * 1024
+# Errors worth retrying a batch commit for
+RETRYABLE_ERRORS = (api_exceptions.Aborted, api_exceptions.DeadlineExceeded,
+                    api_exceptions.InternalServerError, api_exceptions.ResourceExhausted,
+                    api_exceptions.ServiceUnavailable)
+
+def _iter_json_array(f):
+    """Yield the items of a JSON array from a text file, a chunk at a time."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(IMPORT_CHUNK_SIZE)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+    
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+    
+    skip(' \t\r\n')
+    if buf[pos:pos + 1] != '[':
+        raise ValueError('Expected a JSON array')
+    pos += 1
+    while True:
+        skip(' \t\r\n,')
+        if pos >= len(buf):
+            raise ValueError('Unterminated JSON array')
+        if buf[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Most likely an item cut off at the end of the chunk
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buf) and not eof:
+            # A number may continue in the next chunk
+            fill()
+            continue
+        pos = end
+        yield item
+
+def iter_words_file(filename):
+    """Yield words from a JSON array of strings or a text file with one word per line."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        items = _iter_json_array(f) if first == '[' else f
+        for item in items:
+            if isinstance(item, str) and item.strip():
+                yield item.strip()
+
+def _commit_words(words, fields):
+    """Write one batch of words, retrying transient errors. Returns True if it was committed."""
     batch = db.batch()
-    count = 0
-    
-    for word in word_list:
-        word_id = word.lower().replace(' ', '-')
-        word_ref = db.collection(COLLECTION_WORDS).document(word_id)
-        
-        batch.set(word_ref, {
-            'text': word,
-            'created_at': datetime.datetime.now(),
-            'last_used': datetime.datetime.now() - datetime.timedelta(days=30)  # Set as not recently used
-        })
-        
-        count += 1
-        if count >= 500:  # Firestore batch limit is 500
+    for word in words:
+        batch.set(db.collection(COLLECTION_WORDS).document(word_id(word)), {'text': word, **fields})
+    for attempt in range(IMPORT_ATTEMPTS):
+        try:
             batch.commit()
-            batch = db.batch()
-            count = 0
-    
-    if count > 0:
-        batch.commit()
+            return True
+        except RETRYABLE_ERRORS as e:
+            if attempt + 1 == IMPORT_ATTEMPTS:
+                logging.warning('Giving up on a batch of %d words: %s', len(words), e)
+                return False
+            time.sleep(2 ** attempt + random.random())
+
+def add_words_from_file(filename):
+    """Add words from a JSON array or newline-delimited text file to the database.
+
+    The file is parsed incrementally and words are deduplicated by document ID,
+    then written in batches of 500 with up to IMPORT_WORKERS commits in flight.
+    Returns totals: {'read', 'duplicates', 'invalid', 'written', 'failed'}.
+    """
+    totals = {'read': 0, 'duplicates': 0, 'invalid': 0, 'written': 0, 'failed': 0}
+    if not os.path.exists(filename):
+        return totals
     
-    return count
\ No newline at end of file
+    now = datetime.datetime.now()
+    fields = {
+        'created_at': now,
+        'last_used': now - datetime.timedelta(days=30)  # Set as not recently used
+    }
+    seen = set()  # word IDs already queued
+    pending = set()
+    
+    def collect(finished):
+        for future in finished:
+            count, ok = future.result()
+            totals['written' if ok else 'failed'] += count
+    
+    def submit(words):
+        nonlocal pending
+        pending.add(pool.submit(lambda: (len(words), _commit_words(words, fields))))
+        if len(pending) >= IMPORT_WORKERS:
+            # Wait for a slot so only IMPORT_WORKERS batches are held in memory
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+    
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+        words = []
+        for word in iter_words_file(filename):
+            totals['read'] += 1
+            doc_id = word_id(word)
+            if '/' in doc_id or doc_id in ('.', '..') or doc_id.startswith('__'):
+                # Not usable as a Firestore document ID
+                totals['invalid'] += 1
+                continue
+            if doc_id in seen:
+                totals['duplicates'] += 1
+                continue
+            seen.add(doc_id)
+            words.append(word)
+            if len(words) == BATCH_SIZE:
+                submit(words)
+                words = []
+        if words:
+            submit(words)
+        collect(wait(pending).done)
+    
+    return totals
@@ -0,0 +1,198 @@
+"""asyncio variant of db_funcs on the Firestore AsyncClient, used by app_async.
+
+Game documents, the word index and every decision about what to write
+(db_funcs.new_game, plan_submission, plan_vote, word_sync_query, ...) are
+shared with db_funcs; only the Firestore I/O lives here. Calls that don't
+depend on each other are awaited together instead of one after another.
+"""
+import asyncio
+import datetime
+import time
+import uuid
+from firebase_admin import firestore
+from firebase_admin import firestore_async
+from google.api_core import exceptions as api_exceptions
+from google.cloud.firestore import async_transactional
+from db_funcs import (COLLECTION_GAMES, COLLECTION_WORDS, SUBCOLLECTION_SUBMISSIONS,
+                      SUBCOLLECTION_VOTES, apply_word_sync, draw_from_index, new_game,
+                      plan_submission, plan_vote, round_reset_fields, touch_fields, vote_id,
+                      voting_open, word_sync_query, word_usage_batches)
+
+# Firebase is initialized by db_funcs
+db = firestore_async.client()
+
+# Sync state of the word index shared with db_funcs in this process
+_word_sync = {'loaded': 0.0, 'synced': 0.0, 'since': None}
+_word_sync_lock = asyncio.Lock()
+
+def _game_ref(game_id):
+    return db.collection(COLLECTION_GAMES).document(game_id)
+
+def _submissions_ref(game_id):
+    return _game_ref(game_id).collection(SUBCOLLECTION_SUBMISSIONS)
+
+def _votes_ref(game_id):
+    return _game_ref(game_id).collection(SUBCOLLECTION_VOTES)
+
+async def create_game():
+    """Create a new game with a unique ID."""
+    game_id = str(uuid.uuid4())
+    await _game_ref(game_id).set(new_game(game_id))
+    return game_id
+
+async def add_player(game_id, player_name):
+    """Add a player to a game. Returns None if the game doesn't exist."""
+    player_id = str(uuid.uuid4())
+    try:
+        # update() fails on a missing document, so no read is needed first
+        await _game_ref(game_id).update({
+            'players': firestore.ArrayUnion([player_id]),
+            f'player_names.{player_id}': player_name,
+            f'scores.{player_id}': 0,
+            **touch_fields()
+        })
+    except api_exceptions.NotFound:
+        return None
+    return player_id
+
+async def get_game(game_id):
+    """Get game state."""
+    game_doc = await _game_ref(game_id).get()
+    if not game_doc.exists:
+        return None
+
+    game_data = game_doc.to_dict()
+
+    # Convert timestamp to ISO format for JSON serialization
+    if 'created_at' in game_data and game_data['created_at']:
+        game_data['created_at'] = game_data['created_at'].isoformat()
+
+    return game_data
+
+async def update_game_state(game_id, updates):
+    """Update game state with the provided updates and bump its version."""
+    await _game_ref(game_id).update({**updates, **touch_fields()})
+    return True
+
+async def get_game_version(game_id):
+    """Return the game's version without reading the rest of it, or None if it doesn't exist."""
+    game_doc = await _game_ref(game_id).get(field_paths=['version'])
+    if not game_doc.exists:
+        return None
+    # Games created before versioning count as version 0
+    return (game_doc.to_dict() or {}).get('version', 0)
+
+async def list_waiting_games():
+    """List games that are in the 'waiting' state."""
+    games = []
+    query = db.collection(COLLECTION_GAMES).where('state', '==', 'waiting')
+    async for doc in query.stream():
+        game_data = doc.to_dict()
+        if 'created_at' in game_data and game_data['created_at']:
+            game_data['created_at'] = game_data['created_at'].isoformat()
+        games.append(game_data)
+
+    return games
+
+async def sync_word_index():
+    """Load the corpus once, then apply only words other instances have used since."""
+    async with _word_sync_lock:
+        now = time.monotonic()
+        query, full = word_sync_query(db.collection(COLLECTION_WORDS), _word_sync, now)
+        if query is not None:
+            since = datetime.datetime.now()
+            apply_word_sync(_word_sync, [doc.to_dict() async for doc in query.stream()], full, now, since)
+
+def draw_words(count):
+    """Draw count distinct words from the index; await sync_word_index() first."""
+    return draw_from_index(count)
+
+async def update_word_usage(words):
+    """Update the last used timestamp for a list of words, committing all batches at once."""
+    batches = []
+    for writes in word_usage_batches(words):
+        batch = db.batch()
+        for doc_id, fields in writes:
+            batch.set(db.collection(COLLECTION_WORDS).document(doc_id), fields, merge=True)
+        batches.append(batch.commit())
+    await asyncio.gather(*batches)
+
+async def start_round(game_id, players, updates):
+    """Deal new word pairs to players and write them to the game with updates.
+
+    The game update and the word usage write are independent, so they are
+    committed concurrently. Returns the word pairs.
+    """
+    words = draw_words(2 * len(players))
+    word_pairs = {player_id: words[2 * i:2 * i + 2] for i, player_id in enumerate(players)}
+    await asyncio.gather(
+        update_game_state(game_id, {**updates, 'word_pairs': word_pairs, **round_reset_fields()}),
+        update_word_usage(words)
+    )
+    return word_pairs
+
+async def add_submission(game_id, player_id, target_player_id, phrase):
+    """Add a phrase submission in one transaction; see db_funcs.add_submission.
+
+    Returns (round_status, error) where error is None, 'not_submitting' or
+    'unknown_target'.
+    """
+    game_ref = _game_ref(game_id)
+
+    @async_transactional
+    async def submit(transaction):
+        snapshot = await game_ref.get(transaction=transaction)
+        round_status, updates, submission, error = plan_submission(
+            snapshot.to_dict() if snapshot.exists else None, player_id, target_player_id, phrase)
+        if error:
+            return None, error
+        transaction.create(_submissions_ref(game_id).document(str(uuid.uuid4())), submission)
+        transaction.update(game_ref, {**updates, **touch_fields()})
+        return round_status, None
+
+    return await submit(db.transaction())
+
+async def get_submissions_for_player(game_id, player_id, round_num):
+    """Get all phrases submitted for a specific player's word pair in a round."""
+    query = (_submissions_ref(game_id)
+             .where('to_player', '==', player_id)
+             .where('round', '==', round_num))
+
+    return [{'id': doc.id, 'phrase': doc.get('phrase')} async for doc in query.stream()]
+
+async def get_vote(game_id, player_id, round_num):
+    """Return the submission ID the player voted for in a round, or None."""
+    vote_doc = await _votes_ref(game_id).document(vote_id(round_num, player_id)).get()
+    return vote_doc.get('submission_id') if vote_doc.exists else None
+
+async def add_vote(game_id, player_id, submission_id):
+    """Add a vote, closing and scoring the round on the last one; see db_funcs.add_vote.
+
+    Returns (round_status, error) where error is None, 'not_voting' or
+    'unknown_submission'.
+    """
+    game_ref = _game_ref(game_id)
+
+    @async_transactional
+    async def vote(transaction):
+        snapshot = await game_ref.get(transaction=transaction)
+        game = snapshot.to_dict() if snapshot.exists else None
+        if not voting_open(game):
+            return None, 'not_voting'
+        vote_ref = _votes_ref(game_id).document(vote_id(game.get('round', 1), player_id))
+        # The submission and any earlier vote are independent reads
+        submission, previous = await asyncio.gather(
+            _submissions_ref(game_id).document(submission_id).get(transaction=transaction),
+            vote_ref.get(transaction=transaction)
+        )
+        round_status, updates, vote_doc, error = plan_vote(
+            game, player_id, submission_id,
+            submission.to_dict() if submission.exists else None,
+            previous.to_dict() if previous.exists else None)
+        if error:
+            return None, error
+        transaction.update(game_ref, {**updates, **touch_fields()})
+        transaction.set(vote_ref, vote_doc)
+        return round_status, None
+
+    return await vote(db.transaction())
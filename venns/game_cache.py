@@ -0,0 +1,35 @@
+"""Serialized /get_game bodies, shared by every poll of the same game version."""
+from collections import OrderedDict
+import threading
+
+# Games whose latest body is kept
+GAME_BODY_CACHE_SIZE = 1000
+
+
+class GameBodyCache:
+    """Maps game_id -> (version, body), evicting the least recently used game.
+
+    Every player in a game polls the same version, so only the first poll
+    after a change has to read and serialize the full game.
+    """
+
+    def __init__(self, max_size=GAME_BODY_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.bodies = OrderedDict()
+
+    def get(self, game_id, version):
+        """The cached body for this exact version of the game, or None."""
+        with self.lock:
+            cached = self.bodies.get(game_id)
+            if cached and cached[0] == version:
+                self.bodies.move_to_end(game_id)
+                return cached[1]
+        return None
+
+    def put(self, game_id, version, body):
+        with self.lock:
+            self.bodies[game_id] = (version, body)
+            self.bodies.move_to_end(game_id)
+            while len(self.bodies) > self.max_size:
+                self.bodies.popitem(last=False)
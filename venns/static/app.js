@@ -15,6 +15,8 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Game state
         gameState: null,
+        gameEtag: null,     // ETag of the last /get_game body
+        gameEtagFor: null,  // game ID that ETag belongs to
         players: [],
         roundStatus: 'submitting', // submitting, voting, finished
         
@@ -318,9 +320,19 @@ document.addEventListener('DOMContentLoaded', function() {
     async function pollGameState() {
         if (!state.currentGameId) return;
         
+        const gameId = state.currentGameId;
         try {
-            const response = await fetchAPI(`/get_game/${state.currentGameId}`);
-            updateGameState(response);
+            // Send the last version seen; the server answers 304 if nothing changed
+            const headers = state.gameEtag && state.gameEtagFor === gameId ? { 'If-None-Match': state.gameEtag } : {};
+            const response = await fetch(`/get_game/${gameId}`, { headers, cache: 'no-store' });
+            if (response.status === 304) return;
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+            }
+            state.gameEtag = response.headers.get('ETag');
+            state.gameEtagFor = gameId;
+            updateGameState(await response.json());
         } catch (error) {
             console.error('Error polling game state:', error);
         }
@@ -431,20 +443,13 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function calculateSubmissionStatus(game) {
-        const submissions = game.submissions || {};
         const players = game.players || [];
         
-        // Count submissions for each player
+        // Submissions received per player, maintained by the server
+        const counts = game.submission_counts || {};
         const submissionCounts = {};
         for (const playerId of players) {
-            submissionCounts[playerId] = 0;
-        }
-        
-        // Count existing submissions
-        for (const submission of Object.values(submissions)) {
-            if (submission.to_player in submissionCounts) {
-                submissionCounts[submission.to_player]++;
-            }
+            submissionCounts[playerId] = counts[playerId] || 0;
         }
         
         // Update submission status
@@ -552,9 +557,8 @@ document.addEventListener('DOMContentLoaded', function() {
             state.votedPhraseId = null;
             
             // Check if I already voted
-            const votes = game.votes || {};
-            if (state.playerId in votes) {
-                state.votedPhraseId = votes[state.playerId];
+            if (response.voted_submission_id) {
+                state.votedPhraseId = response.voted_submission_id;
             }
             
             // Update UI with my word pair
@@ -1,21 +1,23 @@
 #!/usr/bin/env python3
 
-# import json
 import argparse
 import db_funcs
 
 def main():
     parser = argparse.ArgumentParser(description='Upload words to Firebase for Venns with Benefits game')
-    parser.add_argument('file', help='JSON file containing an array of words')
+    parser.add_argument('file', help='JSON file containing an array of words, or a text file with one word per line')
     args = parser.parse_args()
     
     print(f"Uploading words from {args.file}...")
-    successCount = db_funcs.add_words_from_file(args.file)
+    totals = db_funcs.add_words_from_file(args.file)
     
-    if successCount > 0:
-        print(f"{successCount} words uploaded successfully!")
-    else:
+    print(f"{totals['read']} words read, {totals['duplicates']} duplicates and {totals['invalid']} invalid skipped.")
+    if totals['written'] > 0:
+        print(f"{totals['written']} words uploaded successfully!")
+    if totals['failed'] > 0:
+        print(f"Failed to upload {totals['failed']} words.")
+    elif totals['written'] == 0:
         print("Failed to upload words.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
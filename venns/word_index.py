@@ -0,0 +1,94 @@
+"""In-memory index of the venns word corpus by freshness."""
+import datetime
+import heapq
+import random
+import threading
+
+
+def _epoch(when):
+    # Naive datetimes are stored by Firestore as UTC, so read them the same way
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when.timestamp()
+
+
+class WordIndex:
+    """Splits the corpus into fresh words and recently used ones.
+
+    Fresh words (not used within threshold) live in a list with a position map,
+    so sampling is uniform over the whole corpus and removal is O(1). Recently
+    used words sit in a heap ordered by last use and move back to the fresh list
+    once they age past the threshold.
+    """
+
+    def __init__(self, threshold_days):
+        self.threshold = datetime.timedelta(days=threshold_days).total_seconds()
+        self.lock = threading.Lock()
+        self.fresh = []       # words not used within the threshold
+        self.positions = {}   # word -> index in self.fresh
+        self.recent = []      # heap of (last used epoch, word); may hold stale entries
+        self.last_used = {}   # word -> last used epoch
+
+    def __len__(self):
+        with self.lock:
+            return len(self.last_used)
+
+    def load(self, entries, now):
+        """Replace the index with (text, last_used datetime) entries."""
+        with self.lock:
+            self.fresh, self.positions, self.recent, self.last_used = [], {}, [], {}
+            for text, last_used in entries:
+                self._set(text, _epoch(last_used) if last_used else 0.0)
+            self._promote(_epoch(now))
+
+    def mark_used(self, words, when):
+        """Record that words were used at when; newer uses win over older ones."""
+        ts = _epoch(when)
+        with self.lock:
+            for word in words:
+                if ts > self.last_used.get(word, -1.0):
+                    self._set(word, ts)
+
+    def draw(self, count, now):
+        """Up to count distinct words: fresh ones sampled uniformly, then the least recently used."""
+        with self.lock:
+            self._promote(_epoch(now))
+            if len(self.fresh) >= count:
+                return random.sample(self.fresh, count)
+            words = list(self.fresh)
+            oldest = heapq.nsmallest(len(self.recent), self.recent)
+            for ts, word in oldest:
+                if len(words) >= count:
+                    break
+                if self.last_used.get(word) == ts and word not in self.positions:
+                    words.append(word)
+            random.shuffle(words)
+            return words
+
+    def _set(self, word, ts):
+        # Caller holds self.lock; _promote moves the word back to fresh once it ages
+        self.last_used[word] = ts
+        self._remove_fresh(word)
+        heapq.heappush(self.recent, (ts, word))
+
+    def _promote(self, now):
+        # Caller holds self.lock
+        cutoff = now - self.threshold
+        while self.recent and self.recent[0][0] < cutoff:
+            ts, word = heapq.heappop(self.recent)
+            if self.last_used.get(word) == ts:
+                self._add_fresh(word)
+
+    def _add_fresh(self, word):
+        if word not in self.positions:
+            self.positions[word] = len(self.fresh)
+            self.fresh.append(word)
+
+    def _remove_fresh(self, word):
+        i = self.positions.pop(word, None)
+        if i is None:
+            return
+        last = self.fresh.pop()
+        if i < len(self.fresh):
+            self.fresh[i] = last
+            self.positions[last] = i
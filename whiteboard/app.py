@@ -28,6 +28,14 @@ ENGLISH_WORDS = [
 def generate_game_code():
     return str(uuid.uuid4())[:6]
 
+# Helper: commit a route's game writes together when it returns
+def batched_writes(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        with db_funcs.unit_of_work():
+            return f(*args, **kwargs)
+    return decorated
+
 # Lobby: create or join a game
 @app.route("/", methods=["GET"])
 def index():
@@ -58,6 +66,7 @@ def join_game():
     return jsonify({"player_id": player_id})
 
 @app.route("/ready", methods=["POST"])
+@batched_writes
 def player_ready():
     data = request.json
     code = data.get("game_code")
@@ -78,7 +87,7 @@ def player_ready():
                 break
         
         if len(game["players"]) >= 3 and all_ready:
-            current_word = db_funcs.select_fresh_word(code, ENGLISH_WORDS)
+            current_word = db_funcs.select_fresh_word(code, ENGLISH_WORDS, game)
             db_funcs.set_game_state(code, "playing")
             db_funcs.update_game_round(code, game["round"] + 1)
             db_funcs.set_current_word(code, current_word)
@@ -87,7 +96,8 @@ def player_ready():
             for p_id in game["players"]:
                 db_funcs.update_player(code, p_id, {**game["players"][p_id], "answer": None})
             
-            game = db_funcs.get_game(code)  # Refresh game state
+            # All of the above goes out as one update when the route returns
+            return jsonify({"state": "playing", "current_word": current_word})
     
     return jsonify({"state": game["state"], "current_word": game["current_word"]})
 
@@ -96,66 +106,15 @@ def submit_answer():
     data = request.json
     code = data.get("game_code")
     player_id = data.get("player_id")
-    answer = data.get("answer")
+    answer = (data.get("answer") or "").strip().lower()
+    if not answer:
+        return jsonify({"error": "Missing answer"}), 400
     
-    game = db_funcs.get_game(code)
-    if not game or player_id not in game["players"] or game["state"] != "playing":
+    # Answer, scoring, winner check and state change all happen in one commit
+    game = db_funcs.submit_answer(code, player_id, answer)
+    if not game:
         return jsonify({"error": "Invalid game or player or state"}), 400
     
-    # Submit player's answer
-    db_funcs.set_player_answer(code, player_id, answer.strip().lower())
-    
-    # Re-fetch game to check if all have answered
-    game = db_funcs.get_game(code)
-    all_answered = True
-    for p_id, player in game["players"].items():
-        if not player["answer"]:
-            all_answered = False
-            break
-    
-    if all_answered:
-        # Scoring
-        answers = [p["answer"] for p in game["players"].values()]
-        score_map = {}
-        for ans in set(answers):
-            count = answers.count(ans)
-            if count == 2:
-                pts = 3
-            elif count > 2:
-                pts = 1
-            else:
-                pts = 0
-            score_map[ans] = pts
-        
-        # Update each player's score
-        score_updates = {}
-        for p_id, player in game["players"].items():
-            player_answer = player["answer"]
-            score_delta = score_map[player_answer]
-            score_updates[p_id] = score_delta
-        
-        # Update scores in a transaction
-        db_funcs.update_scores_after_round(code, score_updates)
-        
-        # Check for winner
-        game = db_funcs.get_game(code)  # Get updated game state
-        winner = None
-        for pid, p in game["players"].items():
-            if p["score"] >= 20:
-                winner = pid
-        
-        if winner:
-            db_funcs.set_game_state(code, "finished")
-            db_funcs.set_game_winner(code, game["players"][winner]["name"])
-        else:
-            # Move to scoring state, reset ready flags
-            db_funcs.set_game_state(code, "scoring")
-            for p_id in game["players"]:
-                db_funcs.set_player_ready(code, p_id, False)
-        
-        # Get final game state after updates
-        game = db_funcs.get_game(code)
-    
     return jsonify({
         "state": game["state"],
         "scores": {pid: p["score"] for pid, p in game["players"].items()},
@@ -169,54 +128,46 @@ def next_round():
     code = data.get("game_code")
     player_id = data.get("player_id")
     
-    game = db_funcs.get_game(code)
-    if not game or player_id not in game["players"] or game["state"] != "scoring":
+    # Ready flag, all-ready check and the next round's start happen in one commit
+    game = db_funcs.ready_for_next_round(code, player_id, ENGLISH_WORDS)
+    if not game:
         return jsonify({"error": "Invalid game or player or state"}), 400
     
-    db_funcs.set_player_ready(code, player_id, True)
-    
-    # Re-fetch game to check if all players are ready
-    game = db_funcs.get_game(code)
-    all_ready = True
-    for p_id, player in game["players"].items():
-        if not player["ready"]:
-            all_ready = False
-            break
-    
-    # If all ready, start next round
-    if all_ready:
-        current_word = db_funcs.select_fresh_word(code, ENGLISH_WORDS)
-        db_funcs.set_game_state(code, "playing")
-        db_funcs.update_game_round(code, game["round"] + 1)
-        db_funcs.set_current_word(code, current_word)
-        
-        # Reset player answers and ready status
-        for p_id in game["players"]:
-            db_funcs.update_player(code, p_id, {**game["players"][p_id], "answer": None, "ready": False})
-        
-        # Get updated game state
-        game = db_funcs.get_game(code)
-    
     return jsonify({
         "state": game["state"],
         "current_word": game["current_word"],
         "round": game["round"]
     })
 
-@app.route("/state", methods=["GET"])
-def get_state():
-    code = request.args.get("game_code")
+# Longest a /state request waits for the game to change, in seconds
+STATE_WAIT = 25
+
+# Helper: the state polled by clients, or None if the game doesn't exist
+def load_state(code):
     game = db_funcs.get_game(code)
     if not game:
-        return jsonify({"error": "Game not found"}), 404
-    
-    return jsonify({
+        return None
+    return {
+        "version": game.get("version", 0),
         "state": game["state"],
         "round": game["round"],
         "current_word": game["current_word"],
         "players": {pid: {"name": p["name"], "score": p["score"], "answer": p["answer"]} for pid, p in game["players"].items()},
         "winner": game.get("winner")
-    })
+    }
+
+@app.route("/state", methods=["GET"])
+def get_state():
+    code = request.args.get("game_code")
+    if not code:
+        return jsonify({"error": "Missing game code"}), 400
+    # Clients pass the last version they saw; hold the request until the game moves past it
+    version = request.args.get("version", type=int)
+    state = db_funcs.state_watch.wait(code, version, load_state, STATE_WAIT)
+    if not state:
+        return jsonify({"error": "Game not found"}), 404
+    
+    return jsonify(state)
 
 # Static and template serving
 @app.route('/static/<path:path>')
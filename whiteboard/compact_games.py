@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""Expire abandoned lobbies and archive finished or idle games.
+
+Run it on a schedule (cron, Cloud Scheduler) to keep the games collection
+small. Safe to rerun: only games past their TTL are touched.
+"""
+import db_funcs
+
+def main():
+    print("Compacting games...")
+    removed = db_funcs.compact_games()
+    print(f"{removed} games expired or archived.")
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,16 @@
 
 from google.cloud import firestore
 from google.oauth2 import service_account
-from datetime import datetime
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import uuid
 import random
-# import os
+import os
+from matching import AnswerMatcher
+from state_watch import StateWatch
 
 # Initialize Firestore client
 db = firestore.Client(
@@ -15,6 +21,99 @@ db = firestore.Client(
 
 # Game collection reference
 games_ref = db.collection('games')
+# Compact records of games removed from the games collection
+archive_ref = db.collection('whiteboard_archive')
+
+# Lobbies nobody started are deleted after LOBBY_EXPIRY; finished games are
+# archived after that too, and unfinished ones once they reach GAME_TTL
+LOBBY_EXPIRY = timedelta(hours=2)
+GAME_TTL = timedelta(days=1)
+# Games compacted per batch: up to two writes each, under Firestore's 500 limit
+COMPACT_PAGE_SIZE = 250
+
+# Wakes long-polled /state requests when this process writes a game
+state_watch = StateWatch()
+
+# Game writes buffered by the current unit of work: {code: {field path: value}}
+_pending_writes = contextvars.ContextVar("pending_writes", default=None)
+
+# Collect the game writes made inside a block and commit them together
+@contextmanager
+def unit_of_work():
+    """Buffer game field updates made in the block and flush them on exit
+
+    All writes to one game become a single multi-field update, and writes to
+    several games go out in one batch. Reading a game inside the block flushes
+    its pending writes first, so reads still see them. If the block raises,
+    the pending writes are dropped. Nested blocks join the outer one.
+    """
+    if _pending_writes.get() is not None:
+        yield
+        return
+    token = _pending_writes.set({})
+    try:
+        yield
+        flush()
+    finally:
+        _pending_writes.reset(token)
+
+# Commit pending writes for one game, or for all of them
+def flush(code=None):
+    """Commit the current unit of work's pending writes now"""
+    pending = _pending_writes.get()
+    if not pending:
+        return
+    codes = [code] if code is not None else list(pending)
+    updates = {c: pending.pop(c) for c in codes if c in pending}
+    if len(updates) == 1:
+        (c, fields), = updates.items()
+        games_ref.document(c).update({**fields, **_touch()})
+    elif updates:
+        batch = db.batch()
+        for c, fields in updates.items():
+            batch.update(games_ref.document(c), {**fields, **_touch()})
+        batch.commit()
+    for c in updates:
+        state_watch.notify(c)
+
+# Write fields now, or buffer them if a unit of work is open
+def _write(code, updates):
+    pending = _pending_writes.get()
+    if pending is None:
+        games_ref.document(code).update({**updates, **_touch()})
+        state_watch.notify(code)
+        return
+    fields = pending.setdefault(code, {})
+    for path, value in updates.items():
+        _merge_field(fields, path, _copy_value(value))
+
+def _touch():
+    # Every commit to a game bumps its version, which /state long polls wait on
+    return {"version": firestore.Increment(1)}
+
+def _copy_value(value):
+    # Copy maps and lists so later merges can't touch the caller's data; other
+    # values (including Firestore sentinels, compared by identity) are kept as is
+    if isinstance(value, dict):
+        return {k: _copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_value(v) for v in value]
+    return value
+
+def _merge_field(fields, path, value):
+    # Later writes win. Firestore rejects an update that names both a field and
+    # one of its parents, so a child path is folded into a pending parent map.
+    for pending_path in [p for p in fields if p.startswith(path + ".")]:
+        del fields[pending_path]
+    parts = path.split(".")
+    for i in range(1, len(parts)):
+        parent = fields.get(".".join(parts[:i]))
+        if isinstance(parent, dict):
+            for part in parts[i:-1]:
+                parent = parent.setdefault(part, {})
+            parent[parts[-1]] = value
+            return
+    fields[path] = value
 
 # Create a new game
 def create_game(code):
@@ -24,7 +123,9 @@ def create_game(code):
         "round": 0,
         "current_word": None,
         "state": "lobby",
-        "used_words": [],
+        "deck_seed": random.getrandbits(32),  # word order for this game, see select_fresh_word
+        "deck_cursor": 0,  # words drawn so far
+        "version": 1,  # bumped by every write, see /state
         "created_at": firestore.SERVER_TIMESTAMP
     }
     games_ref.document(code).set(game_data)
@@ -33,6 +134,7 @@ def create_game(code):
 # Get game by code
 def get_game(code):
     """Get game data by game code"""
+    flush(code)
     game_doc = games_ref.document(code).get()
     if not game_doc.exists:
         return None
@@ -41,114 +143,260 @@ def get_game(code):
 # Update game data
 def update_game(code, data):
     """Update game with provided data dict"""
-    games_ref.document(code).update(data)
+    _write(code, data)
 
 # Add player to game
 def add_player(code, player_id, player_data):
     """Add a player to a game"""
-    games_ref.document(code).update({
+    _write(code, {
         f"players.{player_id}": player_data
     })
 
 # Update player data
 def update_player(code, player_id, player_data):
     """Update specific player data"""
-    games_ref.document(code).update({
+    _write(code, {
         f"players.{player_id}": player_data
     })
 
 # Set player ready status
 def set_player_ready(code, player_id, ready=True):
     """Set a player's ready status"""
-    games_ref.document(code).update({
+    _write(code, {
         f"players.{player_id}.ready": ready
     })
 
 # Set player answer
 def set_player_answer(code, player_id, answer):
     """Set a player's answer"""
-    games_ref.document(code).update({
+    _write(code, {
         f"players.{player_id}.answer": answer
     })
 
 # Update player score
 def update_player_score(code, player_id, score):
     """Update a player's score"""
-    games_ref.document(code).update({
+    _write(code, {
         f"players.{player_id}.score": score
     })
 
 # Set game state
 def set_game_state(code, state):
     """Update game state"""
-    games_ref.document(code).update({
+    _write(code, {
         "state": state
     })
 
 # Update game round
 def update_game_round(code, round_num):
     """Update game round number"""
-    games_ref.document(code).update({
+    _write(code, {
         "round": round_num
     })
 
 # Set current word
 def set_current_word(code, word):
     """Set the current word for the game"""
-    games_ref.document(code).update({
+    _write(code, {
         "current_word": word
     })
 
 # Set game winner
 def set_game_winner(code, winner):
     """Set the game winner"""
-    games_ref.document(code).update({
+    _write(code, {
         "winner": winner
     })
 
-# Select a fresh word that hasn't been used yet in this game
-def select_fresh_word(code, word_list):
-    """Select a word that hasn't been used yet in this game"""
-    game = get_game(code)
-    used_words = game.get("used_words", [])
-    
-    # If all words have been used, reset the list
-    if len(used_words) >= len(word_list) * 0.8:  # Reset when 80% of words used
-        update_game(code, {"used_words": []})
-        used_words = []
+# Shuffled word order for a deck seed, as indexes into the word list
+@lru_cache(maxsize=256)
+def _deck_order(seed, size):
+    order = list(range(size))
+    random.Random(seed).shuffle(order)
+    return tuple(order)
+
+# Draw the next word from the game's shuffled deck
+def select_fresh_word(code, word_list, game=None):
+    """Select a word that hasn't been used yet in this game (pass game to skip re-reading it)
+
+    Each game walks a seeded shuffle of word_list with a cursor, so every word
+    comes up once before any repeats, and each pass through the list is
+    shuffled again. The game only stores the seed and the cursor.
+    """
+    if game is None:
+        game = get_game(code)
+    selected_word, updates = _draw_word(game, word_list)
+    update_game(code, updates)
     
-    # Find words that haven't been used yet
-    available_words = [word for word in word_list if word not in used_words]
+    return selected_word
+
+# Next word of the game's deck and the deck fields to write for it
+def _draw_word(game, word_list):
+    seed = game.get("deck_seed")
+    cursor = game.get("deck_cursor", 0)
+    updates = {}
+    if seed is None:
+        # Game from before decks: start one and drop the old used-word list
+        seed = random.getrandbits(32)
+        cursor = 0
+        updates = {"deck_seed": seed, "used_words": firestore.DELETE_FIELD}
     
-    # If all words have been used (shouldn't happen with the reset above), use any word
-    if not available_words:
-        selected_word = random.choice(word_list)
-    else:
-        selected_word = random.choice(available_words)
+    deck_pass, position = divmod(cursor, len(word_list))
+    updates["deck_cursor"] = cursor + 1
+    return word_list[_deck_order(seed + deck_pass, len(word_list))[position]], updates
+
+# Score needed to win the game
+WINNING_SCORE = 20
+
+# Folds answers so plurals, articles and listed synonyms match; the synonym
+# map is an optional JSON file of {"head word": ["synonym", ...]}
+matcher = AnswerMatcher.from_file(os.environ.get("WHITEBOARD_SYNONYMS", "synonyms.json"))
+
+# Points for each player's answer in a round
+def score_answers(answers):
+    """3 points for matching exactly one other player, 1 for a bigger group, 0 otherwise
+
+    Answers match when they fold to the same canonical key (see matching.py).
+    """
+    keys = matcher.cluster(answers)
+    counts = Counter(keys.values())
+    return {pid: 3 if counts[key] == 2 else 1 if counts[key] > 2 else 0 for pid, key in keys.items()}
+
+# Record an answer and, if it was the last one, score and close the round
+def submit_answer(code, player_id, answer):
+    """Write the answer and any round finalization in one transaction
+
+    Once every player has answered, the same commit adds the round's points,
+    sets the winner or moves to scoring, and resets ready flags. Concurrent
+    last answers are serialized by the transaction, so a round is scored
+    exactly once. Returns the updated game, or None if the game isn't
+    accepting answers from this player.
+    """
+    # The transaction reads the game, so it has to see any buffered writes
+    flush(code)
+    game_ref = games_ref.document(code)
     
-    # Add the selected word to the used words list
-    update_game(code, {"used_words": firestore.ArrayUnion([selected_word])})
+    @firestore.transactional
+    def submit(transaction):
+        snapshot = game_ref.get(transaction=transaction)
+        game = snapshot.to_dict() if snapshot.exists else None
+        if not game or player_id not in game["players"] or game["state"] != "playing":
+            return None
+        players = game["players"]
+        players[player_id]["answer"] = answer
+        game["version"] = game.get("version", 0) + 1
+        updates = {f"players.{player_id}.answer": answer, "version": game["version"]}
+        
+        if all(p["answer"] for p in players.values()):
+            points = score_answers({pid: p["answer"] for pid, p in players.items()})
+            winner = None
+            for pid, p in players.items():
+                p["score"] += points[pid]
+                updates[f"players.{pid}.score"] = p["score"]
+                if p["score"] >= WINNING_SCORE:
+                    winner = pid
+            if winner:
+                game["state"] = updates["state"] = "finished"
+                game["winner"] = updates["winner"] = players[winner]["name"]
+            else:
+                # Move to scoring state, reset ready flags
+                game["state"] = updates["state"] = "scoring"
+                for pid, p in players.items():
+                    p["ready"] = updates[f"players.{pid}.ready"] = False
+        
+        transaction.update(game_ref, updates)
+        return game
     
-    return selected_word
+    game = submit(db.transaction())
+    if game:
+        state_watch.notify(code)
+    return game
+
+# Mark a player ready for the next round and start it once everyone is
+def ready_for_next_round(code, player_id, word_list):
+    """Write the ready flag and, if everyone is now ready, the next round's start in one transaction
 
-# Transaction for updating scores after a round
-def update_scores_after_round(code, score_updates):
-    """Update player scores in a transaction"""
-    transaction = db.transaction()
+    Two last players pressing ready at once are serialized by the transaction,
+    so the later one always sees both flags and the round starts exactly once.
+    Returns the updated game, or None if the game isn't showing scores or the
+    player isn't in it.
+    """
+    # The transaction reads the game, so it has to see any buffered writes
+    flush(code)
     game_ref = games_ref.document(code)
     
     @firestore.transactional
-    def update_scores_transaction(transaction, ref, updates):
-        game = ref.get(transaction=transaction).to_dict()
-        for player_id, score_delta in updates.items():
-            current_score = game["players"][player_id]["score"]
-            game["players"][player_id]["score"] = current_score + score_delta
+    def ready(transaction):
+        snapshot = game_ref.get(transaction=transaction)
+        game = snapshot.to_dict() if snapshot.exists else None
+        if not game or player_id not in game["players"] or game["state"] != "scoring":
+            return None
+        players = game["players"]
+        players[player_id]["ready"] = True
+        game["version"] = game.get("version", 0) + 1
+        updates = {f"players.{player_id}.ready": True, "version": game["version"]}
         
-        transaction.update(ref, {
-            f"players.{pid}.score": game["players"][pid]["score"] 
-            for pid in updates.keys()
-        })
+        if all(p["ready"] for p in players.values()):
+            game["current_word"], deck_updates = _draw_word(game, word_list)
+            updates.update(deck_updates)
+            updates["current_word"] = game["current_word"]
+            game["state"] = updates["state"] = "playing"
+            game["round"] = updates["round"] = game["round"] + 1
+            # Reset player answers and ready status
+            for pid, p in players.items():
+                p["answer"] = updates[f"players.{pid}.answer"] = None
+                p["ready"] = updates[f"players.{pid}.ready"] = False
+        
+        transaction.update(game_ref, updates)
         return game
     
-    return update_scores_transaction(transaction, game_ref, score_updates)
+    game = ready(db.transaction())
+    if game:
+        state_watch.notify(code)
+    return game
+
+# Compact record of a game for the archive
+def archive_doc(game, now):
+    """When the game ran, how far it got and the final scores by name"""
+    return {
+        "created_at": game.get("created_at"),
+        "archived_at": now,
+        "state": game.get("state"),
+        "rounds": game.get("round", 0),
+        "winner": game.get("winner"),
+        "scores": {p.get("name", pid): p.get("score", 0) for pid, p in game.get("players", {}).items()}
+    }
 
+# Expire old lobbies and archive finished or abandoned games
+def compact_games(now=None):
+    """Delete expired lobbies and archive old games. Returns the number of games removed"""
+    now = now or datetime.now(timezone.utc)
+    # Poetry4n games share this collection but use createdAt, so the query skips them
+    query = (games_ref
+             .where("created_at", "<", now - min(LOBBY_EXPIRY, GAME_TTL))
+             .order_by("created_at")
+             .select(["state", "created_at", "round", "winner", "players"])
+             .limit(COMPACT_PAGE_SIZE))
+    removed = 0
+    last = None
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        batch = db.batch()
+        page_removed = 0
+        for game_doc in page:
+            game = game_doc.to_dict()
+            if game.get("state") == "lobby":
+                batch.delete(game_doc.reference)
+            elif game.get("state") == "finished" or game["created_at"] < now - GAME_TTL:
+                # Archive and delete in the same batch so a game is never half-removed
+                batch.set(archive_ref.document(game_doc.id), archive_doc(game, now))
+                batch.delete(game_doc.reference)
+            else:
+                continue
+            page_removed += 1
+        if page_removed:
+            batch.commit()
+            removed += page_removed
+        if len(page) < COMPACT_PAGE_SIZE:
+            return removed
+        last = page[-1]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Answer matching for whiteboard scoring
+
+Answers are folded to a canonical form so "Rockets", "rocket" and "a rocket"
+count as the same answer: punctuation and leading articles are dropped, plurals
+and -ing/-ed endings are folded word by word, and an optional synonym map sends
+whole answers to a shared head word. Folded words and answers are memoized in
+dicts, so scoring a room is one dictionary lookup per answer after warm-up.
+"""
+
+import json
+import os
+import re
+
+# Dropped from the start of an answer
+ARTICLES = {"a", "an", "the", "some"}
+
+# Plurals the suffix rules get wrong
+IRREGULAR_PLURALS = {
+    "children": "child", "people": "person", "men": "man", "women": "woman",
+    "mice": "mouse", "geese": "goose", "teeth": "tooth", "feet": "foot",
+    "oxen": "ox", "dice": "die", "knives": "knife", "wives": "wife",
+    "lives": "life", "leaves": "leaf", "wolves": "wolf", "halves": "half",
+    "shelves": "shelf", "thieves": "thief", "loaves": "loaf", "scarves": "scarf",
+    "elves": "elf", "calves": "calf", "cacti": "cactus", "fungi": "fungus",
+}
+
+# Words that look plural or inflected but aren't
+PROTECTED_WORDS = {
+    "news", "series", "species", "physics", "glasses", "pants", "scissors",
+    "bus", "gas", "lens", "chess", "dress", "glass", "grass", "moss", "boss",
+    "ring", "king", "thing", "string", "spring", "wing", "swing", "sting",
+    "ceiling", "morning", "evening", "pudding", "red", "bed", "shed", "sled",
+    "seed", "need", "speed", "weed", "bread", "head", "thread", "sped", "wed",
+}
+
+# Folded words and answers kept before the caches are cleared
+CACHE_SIZE = 50000
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_VOWELS = "aeiou"
+_VOWEL_GROUPS = re.compile(r"[aeiou]+")
+
+
+def singular(word):
+    """Fold a plural noun to its singular, leaving other words alone"""
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word in PROTECTED_WORDS or len(word) <= 3:
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "shes", "ches", "xes", "zzes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def stem(word):
+    """Strip -ing and -ed, restoring a dropped -e, so "racing", "raced" and "race" fold together"""
+    # -eed words (breed, proceed, agreed) are too ambiguous to strip
+    if word in PROTECTED_WORDS or word.endswith("eed"):
+        return word
+    for suffix in ("ing", "ed"):
+        base = word[:-len(suffix)]
+        if word.endswith(suffix) and len(base) >= 3:
+            # running -> run, hopped -> hop
+            if len(base) >= 4 and base[-1] == base[-2] and base[-1] not in "lsz":
+                return base[:-1]
+            # raced -> race, solving -> solve
+            if not base.endswith("e") and _dropped_e(base):
+                return base + "e"
+            return base
+    return word
+
+
+def _dropped_e(base):
+    # English words don't end in -v or consonant + c, so those lost an -e. Otherwise
+    # only one-syllable consonant-vowel-consonant stems get it back: "rac" -> "race"
+    # but "open" and "visit" stay as they are
+    if base[-1] == "v" or (base[-1] == "c" and base[-2] not in _VOWELS):
+        return True
+    return (len(_VOWEL_GROUPS.findall(base)) == 1 and base[-1] not in _VOWELS + "wxy"
+            and base[-2] in _VOWELS and base[-3] not in _VOWELS)
+
+
+class AnswerMatcher:
+    """Maps answers to canonical keys; answers with the same key match"""
+
+    def __init__(self, synonyms=None):
+        self.words = {}    # word -> folded word
+        self.answers = {}  # answer -> canonical key
+        # Synonym groups {"rocket": ["spaceship", ...]} as folded phrase -> folded head
+        self.synonyms = {}
+        for head, alternatives in (synonyms or {}).items():
+            key = self._fold(head)
+            for alternative in [head, *alternatives]:
+                self.synonyms[self._fold(alternative)] = key
+
+    @classmethod
+    def from_file(cls, path):
+        """Matcher with the synonym map in a JSON file, or none if the file doesn't exist"""
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls()
+
+    def canonical(self, answer):
+        """Canonical key of an answer"""
+        key = self.answers.get(answer)
+        if key is None:
+            # Answers with nothing left to fold (all punctuation) only match themselves
+            folded = self._fold(answer) or answer.strip().lower()
+            key = self.synonyms.get(folded, folded)
+            if len(self.answers) >= CACHE_SIZE:
+                self.answers.clear()
+            self.answers[answer] = key
+        return key
+
+    def cluster(self, answers):
+        """Canonical key per player for {player_id: answer}, in one pass"""
+        return {pid: self.canonical(answer) for pid, answer in answers.items()}
+
+    def _fold(self, text):
+        tokens = _PUNCTUATION.sub(" ", text.lower()).split()
+        while len(tokens) > 1 and tokens[0] in ARTICLES:
+            tokens.pop(0)
+        return " ".join(self._fold_word(token) for token in tokens)
+
+    def _fold_word(self, word):
+        folded = self.words.get(word)
+        if folded is None:
+            folded = stem(singular(word))
+            if len(self.words) >= CACHE_SIZE:
+                self.words.clear()
+            self.words[word] = folded
+        return folded
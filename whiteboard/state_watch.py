@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Per-game wakeups for long-polled /state requests
+
+Requests waiting on the same game share one entry: a condition to sleep on
+and the latest state loaded for the game. A write in this process marks the
+entry stale and wakes its waiters, and one of them reloads the state for all
+of them. Writes from other processes are picked up by reloading at most once
+per refresh interval while someone is waiting, so an idle room costs one read
+per interval however many players are polling.
+"""
+
+import threading
+import time
+
+# Seconds a loaded state is trusted before a waiter reloads it
+REFRESH_INTERVAL = 5
+# Games tracked before entries nobody is waiting on are dropped
+MAX_GAMES = 1000
+
+
+class _GameWatch:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.state = None      # latest loaded state, None if the game doesn't exist
+        self.loaded_at = None  # monotonic time of the last load, None if never loaded
+        self.stale = False     # written since the last load
+        self.loading = False   # a waiter is loading the state
+        self.waiters = 0       # guarded by StateWatch._lock
+
+
+class StateWatch:
+    """Long-poll waits on game states, sharing one load per game between waiters"""
+
+    def __init__(self, refresh=REFRESH_INTERVAL, max_games=MAX_GAMES):
+        self.refresh = refresh
+        self.max_games = max_games
+        self._lock = threading.Lock()
+        self._games = {}  # code -> _GameWatch
+
+    def wait(self, code, seen, load, timeout):
+        """The game's state once its version differs from seen, or the current state at timeout
+
+        load(code) returns a state dict with a "version", or None if the game
+        doesn't exist. A seen of None returns the current state right away.
+        """
+        watch = self._join(code)
+        deadline = time.monotonic() + timeout
+        try:
+            with watch.cond:
+                while True:
+                    now = time.monotonic()
+                    fresh = (watch.loaded_at is not None and not watch.stale
+                             and now - watch.loaded_at < self.refresh)
+                    if fresh:
+                        if (watch.state is None or seen is None
+                                or watch.state["version"] != seen or now >= deadline):
+                            return watch.state
+                        watch.cond.wait(min(deadline, watch.loaded_at + self.refresh) - now)
+                    elif watch.loading:
+                        watch.cond.wait()
+                    else:
+                        self._load(watch, code, load)
+        finally:
+            with self._lock:
+                watch.waiters -= 1
+
+    def notify(self, code):
+        """Mark the game changed and wake the requests waiting on it"""
+        with self._lock:
+            watch = self._games.get(code)
+        if watch:
+            with watch.cond:
+                watch.stale = True
+                watch.cond.notify_all()
+
+    def _join(self, code):
+        # Entry for the game with this request counted as a waiter, so it can't be dropped
+        with self._lock:
+            watch = self._games.get(code)
+            if watch is None:
+                if len(self._games) >= self.max_games:
+                    for idle in [c for c, w in self._games.items() if not w.waiters]:
+                        del self._games[idle]
+                watch = self._games[code] = _GameWatch()
+            watch.waiters += 1
+            return watch
+
+    def _load(self, watch, code, load):
+        # Called holding watch.cond; it is released during the load so other
+        # waiters sleep until the result is in. A write during the load sets
+        # stale again, so the next check reloads.
+        watch.loading = True
+        watch.stale = False
+        watch.cond.release()
+        loaded = False
+        try:
+            state = load(code)
+            loaded = True
+        finally:
+            watch.cond.acquire()
+            watch.loading = False
+            if loaded:
+                watch.state = state
+                watch.loaded_at = time.monotonic()
+            else:
+                # The next waiter retries the load
+                watch.stale = True
+            watch.cond.notify_all()
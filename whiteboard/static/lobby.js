@@ -2,6 +2,8 @@
 let playerId = null;
 let gameCode = null;
 let waitingForNextRound = false; // Track if player is waiting for next round
+let stateVersion = null; // Version of the last game state shown
+let polling = false; // A /state long poll is in flight
 
 function createGame() {
     const name = document.getElementById('name').value;
@@ -73,8 +75,8 @@ function showGameScreen(word) {
 function showWaitingScreen(answer) {
     const gameDiv = document.getElementById('game');
     gameDiv.innerHTML = `<h2>Your answer: ${answer}</h2><div id="game_status">Waiting for other players to submit...</div>`;
-    // Poll more frequently while waiting
-    setTimeout(pollState, 1000);
+    // Wait for the other answers
+    pollState();
 }
 
 function submitAnswer() {
@@ -104,8 +106,8 @@ function showScoreboard(scores, answers, names) {
     if (waitingForNextRound) {
         document.getElementById('game_status').innerText = 'Waiting for others...';
     }
-    // Keep polling in scoring state so all players see the scoreboard
-    setTimeout(pollState, 2000);
+    // Keep polling in scoring state so all players see the next round start
+    pollState();
 }
 
 function readyForNextRound() {
@@ -130,8 +132,25 @@ function showWinner(winner, players) {
     gameDiv.innerHTML = `<h2>Winner: ${winner}</h2><ul>${scoreList}</ul><button onclick="location.reload()">Play Again</button>`;
 }
 
+// Long poll: the server answers as soon as the game's version moves past
+// stateVersion, or with the same state after a timeout
 function pollState() {
-    fetch(`/state?game_code=${gameCode}`).then(r => r.json()).then(data => {
+    // Only one poll at a time; a write by this player wakes it anyway
+    if (polling) return;
+    polling = true;
+    const since = stateVersion === null ? '' : `&version=${stateVersion}`;
+    fetch(`/state?game_code=${gameCode}${since}`).then(r => r.json()).then(data => {
+        polling = false;
+        if (data.error) {
+            setTimeout(pollState, 2000);
+            return;
+        }
+        if (data.version === stateVersion) {
+            // Timed out with no change
+            pollState();
+            return;
+        }
+        stateVersion = data.version;
         if (data.state === 'playing' && data.current_word) {
             waitingForNextRound = false; // Reset flag for new round
             // Check if this player has already submitted an answer
@@ -162,7 +181,10 @@ function pollState() {
                 players += `<li>${data.players[pid].name}: ${data.players[pid].score} pts</li>`;
             }
             document.getElementById('players').innerHTML = `<ul>${players}</ul>`;
-            setTimeout(pollState, 2000);
+            pollState();
         }
+    }).catch(() => {
+        polling = false;
+        setTimeout(pollState, 2000);
     });
 }